@@ -0,0 +1,208 @@
+"""Контроль допуска запросов: ограничение параллельности и быстрый отказ при перегрузке.
+
+Одновременно обрабатывается не больше ADMISSION_LIMIT запросов на воркер (по умолчанию -
+вдвое больше соединений пула, с запасом на ответы из кэша), отдельные маршруты дополнительно
+ограничены ADMISSION_ROUTE_LIMITS. Остальные ждут в очереди из ADMISSION_QUEUE_SIZE мест
+не дольше ADMISSION_QUEUE_TIMEOUT секунд и получают 503 с Retry-After, а не копятся
+в ожидании соединения из пула, увеличивая задержку всем.
+
+Очередь упорядочена по приоритету: чтения, затем записи, затем дорогие записи с bcrypt
+(ADMISSION_LOW_PRIORITY_ROUTES). Если очередь полна, новый запрос вытесняет из нее
+ожидающий с более низким приоритетом."""
+import asyncio
+import bisect
+import itertools
+import os
+
+from aiohttp import web
+
+from metrics import Counter, registry, route_name
+from serialization import dumps
+
+ADMISSION_LIMIT = int(os.getenv("ADMISSION_LIMIT", 0))  # 0 - по размеру пула соединений (см. server.create_app).
+ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", 128))  # Мест в очереди ожидания.
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", 1.0))  # Сколько ждать в очереди, секунды.
+ADMISSION_RETRY_AFTER = int(os.getenv("ADMISSION_RETRY_AFTER", 1))  # Retry-After в ответе 503, секунды.
+# Ограничения отдельных маршрутов: "МЕТОД шаблон=лимит", через запятую.
+ADMISSION_ROUTE_LIMITS = os.getenv("ADMISSION_ROUTE_LIMITS", "POST /user=8,POST /user/bulk=2")
+ADMISSION_LOW_PRIORITY_ROUTES = os.getenv("ADMISSION_LOW_PRIORITY_ROUTES", "POST /user,POST /user/bulk")
+
+# Приоритеты: меньше - раньше.
+PRIORITY_READ = 0
+PRIORITY_WRITE = 1
+PRIORITY_LOW = 2
+
+admission_requests = registry.register(Counter(
+    "admission_requests_total", "Requests by admission outcome.", ("route", "outcome")))
+
+
+def parse_route_limits(value: str) -> dict[str, int]:
+    limits = {}
+    for part in value.split(','):
+        route, _, limit = part.rpartition('=')
+        if route.strip():
+            limits[route.strip()] = int(limit)
+    return limits
+
+
+def overloaded(msg: str) -> web.HTTPServiceUnavailable:
+    return web.HTTPServiceUnavailable(text=dumps({"error": msg}).decode(), content_type='application/json',
+                                      headers={"Retry-After": str(ADMISSION_RETRY_AFTER)})
+
+
+class _Waiter:
+    __slots__ = ('priority', 'seq', 'route', 'future')
+
+    def __init__(self, priority: int, seq: int, route: str, future: asyncio.Future):
+        self.priority = priority
+        self.seq = seq
+        self.route = route
+        self.future = future  # Результат True - допущен, False - вытеснен из очереди.
+
+    def __lt__(self, other: '_Waiter') -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class AdmissionController:
+
+    def __init__(self, limit: int = ADMISSION_LIMIT, queue_size: int = ADMISSION_QUEUE_SIZE,
+                 timeout: float = ADMISSION_QUEUE_TIMEOUT, route_limits: dict[str, int] | None = None):
+        self.limit = limit
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.route_limits = route_limits if route_limits is not None else parse_route_limits(ADMISSION_ROUTE_LIMITS)
+        self.active = 0
+        self.route_active: dict[str, int] = {}
+        self._queue: list[_Waiter] = []  # Отсортирована по (приоритет, порядок прихода).
+        self._seq = itertools.count()
+        self.admitted = 0
+        self.queued = 0  # Сколько запросов ждали в очереди, всего.
+        self.rejected = 0  # Очередь полна.
+        self.evicted = 0  # Вытеснены из очереди запросом с более высоким приоритетом.
+        self.timed_out = 0
+        self.max_queue_depth = 0
+
+    def _has_capacity(self, route: str) -> bool:
+        if self.active >= self.limit:
+            return False
+        route_limit = self.route_limits.get(route)
+        return route_limit is None or self.route_active.get(route, 0) < route_limit
+
+    def _take(self, route: str):
+        self.active += 1
+        self.route_active[route] = self.route_active.get(route, 0) + 1
+        self.admitted += 1
+        admission_requests.inc(route, "admitted")
+
+    def _reject(self, route: str, msg: str):
+        admission_requests.inc(route, "rejected")
+        raise overloaded(msg)
+
+    async def acquire(self, route: str, priority: int):
+        """Занимает место для запроса или отвечает 503 (web.HTTPServiceUnavailable)."""
+        if self._has_capacity(route):  # Ожидающие, которым хватает места, уже разбужены в release.
+            self._take(route)
+            return
+
+        if len(self._queue) >= self.queue_size:
+            while self._queue and self._queue[-1].future.done():  # Ушедшие еще не успели выйти из очереди.
+                self._queue.pop()
+        if len(self._queue) >= self.queue_size:
+            worst = self._queue[-1] if self._queue else None
+            if worst is None or worst.priority <= priority:
+                self.rejected += 1
+                self._reject(route, 'Server is overloaded, try again later')
+            self._queue.pop()
+            self.evicted += 1
+            worst.future.set_result(False)
+
+        waiter = _Waiter(priority, next(self._seq), route, asyncio.get_running_loop().create_future())
+        bisect.insort(self._queue, waiter)
+        self.queued += 1
+        self.max_queue_depth = max(self.max_queue_depth, len(self._queue))
+        admission_requests.inc(route, "queued")
+        try:
+            async with asyncio.timeout(self.timeout):
+                admitted = await waiter.future
+        except TimeoutError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                admitted = waiter.future.result()  # Решение принято одновременно с истечением срока.
+            else:
+                self._discard(waiter)
+                self.timed_out += 1
+                self._reject(route, 'Server is overloaded, request timed out in queue')
+        except asyncio.CancelledError:  # Клиент ушел, пока запрос ждал.
+            if waiter.future.done() and not waiter.future.cancelled() and waiter.future.result():
+                self.release(route)
+            else:
+                self._discard(waiter)
+            raise
+        if not admitted:
+            self._reject(route, 'Server is overloaded, try again later')
+
+    def _discard(self, waiter: _Waiter):
+        """Убирает ожидающего из очереди; его могли уже убрать _wake или вытеснение."""
+        if waiter in self._queue:
+            self._queue.remove(waiter)
+
+    def release(self, route: str):
+        self.active -= 1
+        self.route_active[route] -= 1
+        self._wake()
+
+    def _wake(self):
+        """Передает освободившиеся места ожидающим по приоритету, пропуская тех, чей маршрут занят."""
+        index = 0
+        while index < len(self._queue) and self.active < self.limit:
+            waiter = self._queue[index]
+            if waiter.future.done():  # Отменен (клиент ушел, истек срок), но задача еще не вышла из очереди.
+                del self._queue[index]
+            elif self._has_capacity(waiter.route):
+                del self._queue[index]
+                self._take(waiter.route)
+                waiter.future.set_result(True)
+            else:
+                index += 1
+
+    def stats(self) -> dict:
+        return {
+            "limit": self.limit,
+            "active": self.active,
+            "queue_depth": len(self._queue),
+            "max_queue_depth": self.max_queue_depth,
+            "queue_size": self.queue_size,
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected": self.rejected,
+            "evicted": self.evicted,
+            "timed_out": self.timed_out,
+        }
+
+
+admission = AdmissionController()
+LOW_PRIORITY_ROUTES = {route.strip() for route in ADMISSION_LOW_PRIORITY_ROUTES.split(',') if route.strip()}
+
+
+def unlimited(handler):
+    """Маршрут не проходит контроль допуска (метрики, статистика)."""
+    handler.admission = False
+    return handler
+
+
+def request_priority(route: str, method: str) -> int:
+    if route in LOW_PRIORITY_ROUTES:
+        return PRIORITY_LOW
+    return PRIORITY_READ if method in ('GET', 'HEAD') else PRIORITY_WRITE
+
+
+@web.middleware
+async def admission_middleware(request: web.Request, handler):
+    """Пропускает запрос к обработчику, когда для него есть место (см. AdmissionController)."""
+    if request.match_info.http_exception is not None or not getattr(handler, 'admission', True):
+        return await handler(request)
+    route = f"{request.method} {route_name(request)}"
+    await admission.acquire(route, request_priority(route, request.method))
+    try:
+        return await handler(request)
+    finally:
+        admission.release(route)
@@ -0,0 +1,142 @@
+"""Аутентификация по подписанным токенам.
+
+Пароль проверяется через bcrypt один раз, в POST /login. Клиент получает токен
+<данные>.<подпись>: данные - base64url(JSON с claims), подпись - HMAC-SHA256 от данных
+на AUTH_SECRET. Проверка токена в auth_middleware - одно вычисление HMAC, без базы и bcrypt.
+
+Отозванные токены (POST /logout) хранятся в памяти процесса до истечения их срока.
+Как и у кэша сущностей, при нескольких воркерах каждый знает только свои отзывы;
+AUTH_TOKEN_TTL ограничивает, сколько живет токен, отозванный на другом воркере."""
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import os
+import secrets
+import time
+
+from aiohttp import web
+
+from serialization import dumps
+
+logger = logging.getLogger(__name__)
+
+AUTH_SECRET = os.getenv("AUTH_SECRET", "")  # Ключ подписи, общий для всех воркеров и перезапусков.
+AUTH_TOKEN_TTL = int(os.getenv("AUTH_TOKEN_TTL", 3600))  # Срок действия токена, секунды.
+AUTH_REQUIRED_METHODS = ('PATCH', 'DELETE')  # Изменение и удаление - только с токеном.
+
+if not AUTH_SECRET:
+    # Ключ создается при импорте, до запуска воркеров, поэтому он общий для них, но не переживает перезапуск.
+    logger.warning("AUTH_SECRET is not set, tokens will be invalid after restart")
+    AUTH_SECRET = secrets.token_hex(32)
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode()
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))
+
+
+def unauthorized(msg: str) -> web.HTTPUnauthorized:
+    return web.HTTPUnauthorized(text=dumps({"error": msg}).decode(), content_type='application/json',
+                                headers={'WWW-Authenticate': 'Bearer'})
+
+
+class TokenDenylist:
+    """Отозванные токены: jti -> срок действия. Истекшие удаляются, дальше их отвергает проверка срока."""
+
+    def __init__(self):
+        self._revoked: dict[str, int] = {}
+
+    def add(self, jti: str, expires_at: int):
+        now = time.time()
+        self._revoked = {key: exp for key, exp in self._revoked.items() if exp > now}
+        self._revoked[jti] = expires_at
+
+    def __contains__(self, jti: str) -> bool:
+        return jti in self._revoked
+
+    def __len__(self) -> int:
+        return len(self._revoked)
+
+
+class TokenSigner:
+
+    def __init__(self, secret: str, ttl: int):
+        self._key = secret.encode()
+        self.ttl = ttl
+        self.denylist = TokenDenylist()
+        self.issued = 0
+        self.rejected = 0
+
+    def _sign(self, payload: str) -> str:
+        return _b64encode(hmac.new(self._key, payload.encode(), hashlib.sha256).digest())
+
+    def issue(self, user_id: int) -> tuple[str, dict]:
+        """Новый токен пользователя и его claims."""
+        now = int(time.time())
+        claims = {"sub": user_id, "iat": now, "exp": now + self.ttl, "jti": secrets.token_urlsafe(12)}
+        payload = _b64encode(json.dumps(claims, separators=(',', ':')).encode())
+        self.issued += 1
+        return f"{payload}.{self._sign(payload)}", claims
+
+    def verify(self, token: str) -> dict:
+        """claims токена; web.HTTPUnauthorized, если подпись неверна, срок истек или токен отозван."""
+        payload, _, signature = token.partition('.')
+        if not hmac.compare_digest(signature.encode(), self._sign(payload).encode()):
+            self.rejected += 1
+            raise unauthorized('Invalid token')
+        claims = json.loads(_b64decode(payload))
+        if claims["exp"] <= time.time():
+            self.rejected += 1
+            raise unauthorized('Token expired')
+        if claims["jti"] in self.denylist:
+            self.rejected += 1
+            raise unauthorized('Token revoked')
+        return claims
+
+    def revoke(self, claims: dict):
+        self.denylist.add(claims["jti"], claims["exp"])
+
+    def stats(self) -> dict:
+        return {
+            "issued": self.issued,
+            "rejected": self.rejected,
+            "revoked": len(self.denylist),
+        }
+
+
+tokens = TokenSigner(AUTH_SECRET, AUTH_TOKEN_TTL)
+
+
+def get_claims(request: web.Request) -> dict | None:
+    """claims токена запроса (см. auth_middleware) или None для анонимного запроса."""
+    return request.get('claims')
+
+
+def require_claims(request: web.Request) -> dict:
+    claims = get_claims(request)
+    if claims is None:
+        raise unauthorized('Authorization required')
+    return claims
+
+
+@web.middleware
+async def auth_middleware(request: web.Request, handler):
+    """Проверяет заголовок Authorization: Bearer <токен> и кладет claims в request['claims'].
+
+    Для AUTH_REQUIRED_METHODS токен обязателен; права на конкретную запись проверяют обработчики."""
+    header = request.headers.get('Authorization', '')
+    scheme, _, token = header.partition(' ')
+    claims = None
+    if header:
+        if scheme.lower() != 'bearer' or not token:
+            raise unauthorized('Expected Authorization: Bearer <token>')
+        claims = tokens.verify(token.strip())
+    request['claims'] = claims
+    if claims is None and request.method in AUTH_REQUIRED_METHODS and request.match_info.http_exception is None:
+        raise unauthorized('Authorization required')
+    return await handler(request)
@@ -0,0 +1,264 @@
+"""Нагрузочный тест API: пропускная способность и задержки p50/p95/p99 по каждому маршруту.
+
+Перед замером создает своих пользователей и объявления через пакетные маршруты,
+затем N параллельных воркеров в течение заданного времени выполняют запросы
+в заданной пропорции. Результат сохраняется в JSON, с --compare сравнивается
+с прошлым прогоном и завершается с ошибкой при регрессии p99.
+
+Пример (одноразовая база из docker-compose, профиль bench):
+    docker compose --profile bench up -d bench-db
+    POSTGRES_PORT=5433 python -m migrations upgrade
+    POSTGRES_PORT=5433 python server.py &
+    python -m benchmarks.load --concurrency 64 --duration 30 --output bench.json"""
+import argparse
+import asyncio
+import bisect
+import json
+import random
+import sys
+import time
+import uuid
+
+from client import ApiClient, BASE_URL
+
+# Пропорции запросов по умолчанию: чтения преобладают, как в продакшене.
+DEFAULT_MIX = "get_ads=50,get_user=15,user_ads=15,search=10,patch_ads=5,create_ads=5"
+# Границы корзин гистограммы задержек, миллисекунды.
+HISTOGRAM_BOUNDS = [0.5, 1, 2, 3, 5, 7.5, 10, 15, 20, 30, 50, 75, 100, 150, 200, 300, 500, 750, 1000, 2000, 5000]
+BENCH_PASSWORD = 'bench'
+SEARCH_WORDS = ["knife", "bike", "phone", "sofa", "lamp", "table", "watch", "camera"]
+
+
+class Stats:
+    """Задержки и ошибки одного маршрута."""
+
+    def __init__(self):
+        self.latencies: list[float] = []  # Миллисекунды.
+        self.errors = 0
+        self.statuses: dict[str, int] = {}
+
+    def add(self, latency_ms: float, status: int):
+        self.latencies.append(latency_ms)
+        self.statuses[str(status)] = self.statuses.get(str(status), 0) + 1
+        if status >= 500 or status == 0:
+            self.errors += 1
+
+    def summary(self, duration: float) -> dict:
+        values = sorted(self.latencies)
+        histogram = [0] * (len(HISTOGRAM_BOUNDS) + 1)
+        for value in values:
+            histogram[bisect.bisect_left(HISTOGRAM_BOUNDS, value)] += 1
+        return {
+            "count": len(values),
+            "errors": self.errors,
+            "statuses": self.statuses,
+            "throughput_rps": round(len(values) / duration, 2),
+            "mean_ms": round(sum(values) / len(values), 3) if values else None,
+            "p50_ms": percentile(values, 50),
+            "p95_ms": percentile(values, 95),
+            "p99_ms": percentile(values, 99),
+            "max_ms": round(values[-1], 3) if values else None,
+            "histogram": [{"le_ms": bound, "count": count}
+                          for bound, count in zip(HISTOGRAM_BOUNDS + ["+Inf"], histogram)],
+        }
+
+
+def percentile(sorted_values: list[float], p: float) -> float | None:
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(p / 100 * len(sorted_values)) - 1))
+    return round(sorted_values[index], 3)
+
+
+def parse_mix(mix: str) -> dict[str, float]:
+    weights = {}
+    for part in mix.split(','):
+        name, _, weight = part.partition('=')
+        if name.strip() not in OPERATIONS:
+            raise SystemExit(f"Неизвестная операция {name!r}, доступны: {', '.join(OPERATIONS)}")
+        weights[name.strip()] = float(weight or 1)
+    return weights
+
+
+class Fixture:
+    """Данные, созданные для прогона."""
+
+    def __init__(self, prefix: str):
+        self.prefix = prefix
+        self.user_ids: list[int] = []
+        self.ads_ids: list[int] = []
+        self.names: dict[int, str] = {}  # user_id -> имя, для входа.
+        self.owned: dict[int, list[int]] = {}  # user_id -> объявления, для изменений с токеном владельца.
+        self.tokens: dict[int, str] = {}
+        self.counter = 0
+
+    def unique(self, kind: str) -> str:
+        self.counter += 1
+        return f"{self.prefix}-{kind}-{self.counter}"
+
+
+async def seed(client: ApiClient, fixture: Fixture, users: int, ads: int):
+    """Создает пользователей и объявления пакетными запросами."""
+    names = [fixture.unique('user') for _ in range(users)]
+    status, body = await client.create_users([{'name': name, 'password': BENCH_PASSWORD} for name in names])
+    if status != 200:
+        raise SystemExit(f"Не удалось создать пользователей: {status} {body[:200]!r}")
+    created = [r for r in json.loads(body)['results'] if r['status'] == 'created']
+    fixture.user_ids = [r['id'] for r in created]
+    fixture.names = {r['id']: names[r['index']] for r in created}
+    for start in range(0, ads, 1000):
+        batch = [{'title': fixture.unique('ad'),
+                  'description': f"{random.choice(SEARCH_WORDS)} in good condition {i}",
+                  'owner_id': random.choice(fixture.user_ids)}
+                 for i in range(start, min(ads, start + 1000))]
+        status, body = await client.create_ads_bulk(batch)
+        if status != 200:
+            raise SystemExit(f"Не удалось создать объявления: {status} {body[:200]!r}")
+        for r in json.loads(body)['results']:
+            if r['status'] == 'created':
+                fixture.ads_ids.append(r['id'])
+                fixture.owned.setdefault(r['owner_id'], []).append(r['id'])
+
+
+async def login(client: ApiClient, fixture: Fixture, count: int):
+    """Входит за count владельцев объявлений: bcrypt только здесь, запросы под нагрузкой проверяют токен."""
+    for user_id in list(fixture.owned)[:count]:
+        status, body = await client.login(fixture.names[user_id], BENCH_PASSWORD)
+        if status != 200:
+            raise SystemExit(f"Не удалось войти: {status} {body[:200]!r}")
+        fixture.tokens[user_id] = json.loads(body)['token']
+    client.token = None
+
+
+# Операции нагрузки: имя -> корутина (client, fixture) -> статус ответа.
+async def op_get_ads(client, fixture):
+    return (await client.get_ads(random.choice(fixture.ads_ids)))[0]
+
+
+async def op_get_user(client, fixture):
+    return (await client.get_user(random.choice(fixture.user_ids)))[0]
+
+
+async def op_user_ads(client, fixture):
+    return (await client.get_user_ads(random.choice(fixture.user_ids)))[0]
+
+
+async def op_search(client, fixture):
+    return (await client.search_ads(random.choice(SEARCH_WORDS)[:3]))[0]
+
+
+async def op_feed(client, fixture):
+    return (await client.get_feed(owner_id=random.choice(fixture.user_ids)))[0]
+
+
+async def op_patch_ads(client, fixture):
+    user_id = random.choice(list(fixture.tokens))
+    ads_id = random.choice(fixture.owned[user_id])
+    return (await client.with_token(fixture.tokens[user_id]).patch_ads(ads_id, description=fixture.unique('desc')))[0]
+
+
+async def op_create_ads(client, fixture):
+    return (await client.create_ads(random.choice(fixture.user_ids), fixture.unique('ad'), 'created under load'))[0]
+
+
+OPERATIONS = {
+    "get_ads": op_get_ads,
+    "get_user": op_get_user,
+    "user_ads": op_user_ads,
+    "search": op_search,
+    "feed": op_feed,
+    "patch_ads": op_patch_ads,
+    "create_ads": op_create_ads,
+}
+
+
+async def worker(client: ApiClient, fixture: Fixture, weights: dict, stats: dict, deadline: float):
+    names, values = list(weights), list(weights.values())
+    while time.monotonic() < deadline:
+        name = random.choices(names, values)[0]
+        start = time.perf_counter()
+        try:
+            status = await OPERATIONS[name](client, fixture)
+        except Exception:  # Обрыв соединения, таймаут: считаем как ошибку со статусом 0.
+            status = 0
+        stats[name].add((time.perf_counter() - start) * 1000, status)
+
+
+async def run(args) -> dict:
+    weights = parse_mix(args.mix)
+    fixture = Fixture(f"bench-{uuid.uuid4().hex[:8]}")
+    async with ApiClient(args.url, connections=args.concurrency) as client:
+        await seed(client, fixture, args.users, args.ads)
+        await login(client, fixture, args.logins)
+        if args.warmup:
+            warmup = {name: Stats() for name in weights}
+            deadline = time.monotonic() + args.warmup
+            await asyncio.gather(*(worker(client, fixture, weights, warmup, deadline)
+                                   for _ in range(args.concurrency)))
+
+        stats = {name: Stats() for name in weights}
+        started = time.monotonic()
+        deadline = started + args.duration
+        await asyncio.gather(*(worker(client, fixture, weights, stats, deadline) for _ in range(args.concurrency)))
+        duration = time.monotonic() - started
+
+    total = Stats()
+    for item in stats.values():
+        total.latencies.extend(item.latencies)
+        total.errors += item.errors
+    return {
+        "config": {"url": args.url, "concurrency": args.concurrency, "duration": args.duration,
+                   "mix": weights, "users": args.users, "ads": args.ads},
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "endpoints": {name: item.summary(duration) for name, item in stats.items()},
+        "total": total.summary(duration),
+    }
+
+
+def compare(result: dict, baseline: dict, max_regression: float) -> bool:
+    """Печатает сравнение с прошлым прогоном. False - если p99 какого-то маршрута вырос сильнее порога."""
+    ok = True
+    print(f"{'endpoint':<12}{'rps':>10}{'base rps':>10}{'p99':>10}{'base p99':>10}{'change':>9}")
+    for name, current in list(result["endpoints"].items()) + [("total", result["total"])]:
+        base = baseline["total"] if name == "total" else baseline["endpoints"].get(name)
+        if not base or not base["p99_ms"] or not current["p99_ms"]:
+            continue
+        change = current["p99_ms"] / base["p99_ms"] - 1
+        mark = ""
+        if change > max_regression:
+            ok, mark = False, "  REGRESSION"
+        print(f"{name:<12}{current['throughput_rps']:>10}{base['throughput_rps']:>10}"
+              f"{current['p99_ms']:>10}{base['p99_ms']:>10}{change:>+9.1%}{mark}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест API объявлений.")
+    parser.add_argument("--url", default=BASE_URL)
+    parser.add_argument("--concurrency", type=int, default=32, help="параллельных клиентов")
+    parser.add_argument("--duration", type=float, default=30, help="длительность замера, секунды")
+    parser.add_argument("--warmup", type=float, default=3, help="прогрев перед замером, секунды")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="пропорции операций, например get_ads=80,search=20")
+    parser.add_argument("--users", type=int, default=100, help="сколько пользователей создать")
+    parser.add_argument("--ads", type=int, default=2000, help="сколько объявлений создать")
+    parser.add_argument("--logins", type=int, default=10, help="за скольких владельцев войти для patch_ads")
+    parser.add_argument("--output", help="сохранить результат в JSON")
+    parser.add_argument("--compare", help="JSON прошлого прогона для сравнения")
+    parser.add_argument("--max-regression", type=float, default=0.10, help="допустимый рост p99, доля")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    for name, item in list(result["endpoints"].items()) + [("total", result["total"])]:
+        print(f"{name:<12} {item['count']:>8} req {item['throughput_rps']:>9} rps  "
+              f"p50 {item['p50_ms']} ms  p95 {item['p95_ms']} ms  p99 {item['p99_ms']} ms  errors {item['errors']}")
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(result, file, indent=2)
+    if args.compare:
+        with open(args.compare) as file:
+            if not compare(result, json.load(file), args.max_regression):
+                sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
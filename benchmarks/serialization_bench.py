@@ -0,0 +1,53 @@
+"""Микробенчмарк слоя сериализации: стоимость кодирования одного объявления и списка из 10 000.
+
+Сравнивает прежний путь (словарь на объект + json.dumps) с DTO + serialization.dumps.
+Запуск из корня проекта: python -m benchmarks.serialization_bench [--repeat N]"""
+import argparse
+import json
+import timeit
+
+import serialization
+from serialization import AdsDTO, dumps
+
+
+def make_rows(count: int) -> list[tuple]:
+    """Строки в том виде, в котором их возвращает выборка ADS_COLUMNS."""
+    return [(i, f"Selling item number {i}", "Good condition, pick up in the city center. " * 4, i % 1000)
+            for i in range(count)]
+
+
+def legacy_encode(rows) -> bytes:
+    """Как раньше в обработчиках: словарь на каждую строку и web.json_response (json.dumps)."""
+    return json.dumps([
+        {'ads_id': r[0], 'title': r[1], 'description': r[2], "owner_id": r[3]} for r in rows
+    ]).encode()
+
+
+def dto_encode(rows) -> bytes:
+    return dumps([AdsDTO(*r) for r in rows])
+
+
+def measure(func, rows, repeat: int) -> float:
+    """Лучшее время одного вызова в секундах."""
+    number = max(1, 20000 // len(rows))
+    return min(timeit.repeat(lambda: func(rows), number=number, repeat=repeat)) / number
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    encoder = "orjson" if serialization.orjson is not None else "json (stdlib)"
+    print(f"encoder: {encoder}")
+    print(f"{'case':<16}{'legacy, us/obj':>16}{'dto, us/obj':>14}{'speedup':>10}")
+    for name, count in (("single ad", 1), ("10k ads list", 10000)):
+        rows = make_rows(count)
+        assert json.loads(legacy_encode(rows)) == json.loads(dto_encode(rows))
+        legacy = measure(legacy_encode, rows, args.repeat) / count * 1e6
+        dto = measure(dto_encode, rows, args.repeat) / count * 1e6
+        print(f"{name:<16}{legacy:>16.3f}{dto:>14.3f}{legacy / dto:>9.2f}x")
+
+
+if __name__ == "__main__":
+    main()
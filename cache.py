@@ -0,0 +1,150 @@
+import logging
+import os
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+# Настройки кэша сущностей берутся из переменных окружения.
+CACHE_ENABLED = os.getenv("CACHE_ENABLED", "1") == "1"
+CACHE_TTL = float(os.getenv("CACHE_TTL", 30))  # Время жизни записи, секунды.
+CACHE_NEGATIVE_TTL = float(os.getenv("CACHE_NEGATIVE_TTL", 5))  # Время жизни записи "не найдено".
+CACHE_MAX_SIZE = int(os.getenv("CACHE_MAX_SIZE", 10000))  # Максимум записей в памяти процесса.
+
+
+class CacheBackend(ABC):
+    """Интерфейс хранилища кэша.
+
+    Кроме встроенного MemoryCacheBackend можно подключить общее хранилище (например, Redis):
+    тогда все воркеры читают и инвалидируют одни и те же записи и видят изменения друг друга.
+    Значение None означает закэшированное "не найдено".
+    shared = True - хранилище общее для всех процессов-воркеров (см. EntityCache.configure_workers)."""
+
+    evictions = 0
+    shared = False
+
+    @abstractmethod
+    async def get(self, key: str) -> tuple[bool, dict | None]:
+        """Возвращает пару (найдено ли в кэше, значение)."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def set(self, key: str, value: dict | None, ttl: float):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def delete(self, key: str):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def clear(self):
+        raise NotImplementedError
+
+    def __len__(self) -> int:
+        return 0
+
+
+class MemoryCacheBackend(CacheBackend):
+    """LRU-кэш в памяти процесса с ограничением размера и временем жизни записей."""
+
+    def __init__(self, max_size: int = 10000):
+        self.max_size = max_size
+        self._data: OrderedDict[str, tuple[float, dict | None]] = OrderedDict()
+        self.evictions = 0
+
+    async def get(self, key):
+        item = self._data.get(key)
+        if item is None:
+            return False, None
+        expires_at, value = item
+        if expires_at < time.monotonic():  # Запись устарела.
+            del self._data[key]
+            return False, None
+        self._data.move_to_end(key)  # Недавно использованные - в конец очереди.
+        return True, value
+
+    async def set(self, key, value, ttl):
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:  # Вытесняем самые давно использованные записи.
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    async def delete(self, key):
+        self._data.pop(key, None)
+
+    async def clear(self):
+        self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class EntityCache:
+    """Сквозной кэш сущностей по первичному ключу со счетчиками попаданий и промахов."""
+
+    def __init__(self, backend: CacheBackend, ttl: float = 30, negative_ttl: float = 5, enabled: bool = True):
+        self.backend = backend
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+
+    @classmethod
+    def from_env(cls, backend: CacheBackend | None = None) -> "EntityCache":
+        return cls(backend or MemoryCacheBackend(CACHE_MAX_SIZE),
+                   ttl=CACHE_TTL, negative_ttl=CACHE_NEGATIVE_TTL, enabled=CACHE_ENABLED)
+
+    @staticmethod
+    def key(kind: str, entity_id: int) -> str:
+        return f"{kind}:{entity_id}"
+
+    async def get(self, kind: str, entity_id: int) -> tuple[bool, dict | None]:
+        if not self.enabled:
+            return False, None
+        hit, value = await self.backend.get(self.key(kind, entity_id))
+        if not hit:
+            self.misses += 1
+        elif value is None:
+            self.negative_hits += 1
+        else:
+            self.hits += 1
+        return hit, value
+
+    async def set(self, kind: str, entity_id: int, value: dict):
+        if self.enabled:
+            await self.backend.set(self.key(kind, entity_id), value, self.ttl)
+
+    async def set_missing(self, kind: str, entity_id: int):
+        """Запоминает, что сущности нет, чтобы повторные 404 не ходили в базу."""
+        if self.enabled:
+            await self.backend.set(self.key(kind, entity_id), None, self.negative_ttl)
+
+    def configure_workers(self, workers: int):
+        """При нескольких воркерах кэш в памяти процесса отключается: запись на одном воркере
+        сбрасывает только его копию, а остальные до CACHE_TTL отдавали бы старые данные и 404."""
+        if workers > 1 and self.enabled and not self.backend.shared:
+            logger.warning("entity cache is disabled: %s is per process and %s workers are running, "
+                           "connect a shared cache backend", type(self.backend).__name__, workers)
+            self.enabled = False
+
+    async def invalidate(self, kind: str, entity_id: int):
+        if self.enabled:
+            await self.backend.delete(self.key(kind, entity_id))
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "size": len(self.backend),
+            "hits": self.hits,
+            "negative_hits": self.negative_hits,
+            "misses": self.misses,
+            "evictions": self.backend.evictions,
+        }
+
+
+entity_cache = EntityCache.from_env()
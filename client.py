@@ -1,62 +1,145 @@
 import asyncio
+import copy
+import json
+import os
 
 import aiohttp
 
+BASE_URL = os.getenv("API_URL", "http://127.0.0.1:8080")
+
+
+class ApiClient:
+    """Клиент REST API объявлений.
+
+    Все запросы идут через одну aiohttp.ClientSession с пулом соединений,
+    поэтому клиент подходит и для ручных проверок, и для нагрузочного теста (benchmarks/load.py).
+    Изменение и удаление требуют токена: см. login и with_token."""
+
+    def __init__(self, base_url: str = BASE_URL, connections: int = 100, token: str | None = None):
+        self.base_url = base_url.rstrip('/')
+        self.connections = connections
+        self.token = token
+        self.session: aiohttp.ClientSession | None = None
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(limit=self.connections, limit_per_host=self.connections)
+        self.session = aiohttp.ClientSession(self.base_url, connector=connector)
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.session.close()
+
+    async def request(self, method: str, path: str, **kwargs) -> tuple[int, bytes]:
+        """Выполняет запрос и возвращает статус и тело ответа."""
+        if self.token:
+            kwargs['headers'] = {'Authorization': f'Bearer {self.token}', **kwargs.get('headers', {})}
+        async with self.session.request(method, path, **kwargs) as response:
+            return response.status, await response.read()
+
+    def with_token(self, token: str) -> 'ApiClient':
+        """Клиент с другим токеном на той же сессии и пуле соединений."""
+        client = copy.copy(self)
+        client.token = token
+        return client
+
+    # Вход.
+    async def login(self, name: str, password: str):
+        """Получает токен и запоминает его для следующих запросов."""
+        status, data = await self.request('POST', '/login', json={'name': name, 'password': password})
+        if status == 200:
+            self.token = json.loads(data)['token']
+        return status, data
+
+    async def logout(self):
+        status, data = await self.request('POST', '/logout')
+        if status == 200:
+            self.token = None
+        return status, data
+
+    # Пользователи.
+    async def create_user(self, name: str, password: str):
+        return await self.request('POST', '/user', json={'name': name, 'password': password})
+
+    async def get_user(self, user_id: int):
+        return await self.request('GET', f'/user/{user_id}')
+
+    async def patch_user(self, user_id: int, **fields):
+        return await self.request('PATCH', f'/user/{user_id}', json=fields)
+
+    async def delete_user(self, user_id: int):
+        return await self.request('DELETE', f'/user/{user_id}')
+
+    async def create_users(self, users: list[dict]):
+        return await self.request('POST', '/user/bulk', json=users)
+
+    # Объявления.
+    async def create_ads(self, user_id: int, title: str, description: str):
+        return await self.request('POST', f'/user/{user_id}/ads', json={'title': title, 'description': description})
+
+    async def get_ads(self, ads_id: int):
+        return await self.request('GET', f'/ads/{ads_id}')
+
+    async def get_ads_views(self, ads_id: int):
+        return await self.request('GET', f'/ads/{ads_id}/views')
+
+    async def patch_ads(self, ads_id: int, **fields):
+        return await self.request('PATCH', f'/ads/{ads_id}', json=fields)
+
+    async def delete_ads(self, ads_id: int):
+        return await self.request('DELETE', f'/ads/{ads_id}')
+
+    async def create_ads_bulk(self, ads: list[dict]):
+        return await self.request('POST', '/ads/bulk', json=ads)
+
+    async def get_user_ads(self, user_id: int):
+        return await self.request('GET', f'/ads/user/{user_id}')
+
+    async def get_feed(self, limit: int = 20, cursor: str | None = None, **filters):
+        """Страница ленты GET /ads; filters - owner_id, since, until."""
+        params = {'limit': limit, **filters}
+        if cursor:
+            params['cursor'] = cursor
+        return await self.request('GET', '/ads', params=params)
+
+    async def search_ads(self, query: str, limit: int = 20):
+        return await self.request('GET', '/ads/search', params={'q': query, 'limit': limit})
+
 
 async def main():
-    client = aiohttp.ClientSession()
-
-    # Создаем пользователя.
-    # response = await client.post(
-    #     'http://127.0.0.1:8080/user',
-    #     json={'name': 'user_10', 'password': '1234'}
-    # )
-
-    # Просмотр пользователя.
-    # response = await client.get(
-    #     'http://127.0.0.1:8080/user/3',
-    # )
-
-    # Удаление пользователя.
-    # response = await client.delete(
-    #     'http://127.0.0.1:8080/user/8',
-    # )
-
-    # Изменить пользователя.
-    # response = await client.patch(
-    #     'http://127.0.0.1:8080/user/10',
-    #     json={'name': 'new_user2'}
-    # )
-
-    # Создаем объявление.
-    # response = await client.post(
-    #     'http://127.0.0.1:8080/user/4/ads',
-    #     json={'title': 'I\'m selling a knife', 'description': 'good knife'}
-    # )
-
-    # Просмотр объявления.
-    # response = await client.get(
-    #     'http://127.0.0.1:8080/ads/7',
-    # )
-
-    # Изменить объявление.
-    # response = await client.patch(
-    #     'http://127.0.0.1:8080/ads/7',
-    #     json={'title': 'I\'m selling a knife', 'description': 'bad knife'}
-    # )
-
-    # Удаление объявления.
-    # response = await client.delete(
-    #     'http://127.0.0.1:8080/ads/6',
-    # )
-
-    # Просмотр всех объявлений пользователя.
-    response = await client.get(
-        'http://127.0.0.1:8080/ads/user/4',
-    )
-
-    data = await response.text()
-    print(data)
-    await client.close()
-
-asyncio.run(main())
\ No newline at end of file
+    async with ApiClient() as client:
+
+        # Создаем пользователя.
+        # status, data = await client.create_user('user_10', '1234')
+
+        # Вход: изменение и удаление выполняются с полученным токеном.
+        # status, data = await client.login('user_10', '1234')
+
+        # Просмотр пользователя.
+        # status, data = await client.get_user(3)
+
+        # Удаление пользователя.
+        # status, data = await client.delete_user(8)
+
+        # Изменить пользователя.
+        # status, data = await client.patch_user(10, name='new_user2')
+
+        # Создаем объявление.
+        # status, data = await client.create_ads(4, 'I\'m selling a knife', 'good knife')
+
+        # Просмотр объявления.
+        # status, data = await client.get_ads(7)
+
+        # Изменить объявление.
+        # status, data = await client.patch_ads(7, title='I\'m selling a knife', description='bad knife')
+
+        # Удаление объявления.
+        # status, data = await client.delete_ads(6)
+
+        # Просмотр всех объявлений пользователя.
+        status, data = await client.get_user_ads(4)
+
+        print(status, data.decode())
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
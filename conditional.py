@@ -0,0 +1,44 @@
+"""Условные GET-запросы: ETag / Last-Modified и ответ 304 Not Modified."""
+import datetime
+
+from aiohttp import web
+
+
+def make_etag(*parts) -> str:
+    """Сильный ETag из частей, однозначно задающих представление (вид, id, версия...)."""
+    return '"' + '-'.join(str(part) for part in parts) + '"'
+
+
+def to_http_datetime(value: datetime.datetime | float | None) -> datetime.datetime | None:
+    """Время изменения (UTC без часового пояса или Unix timestamp) в виде для Last-Modified."""
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return datetime.datetime.fromtimestamp(value, datetime.timezone.utc)
+    return value.replace(tzinfo=datetime.timezone.utc)
+
+
+def validator_headers(etag: str, last_modified: datetime.datetime | float | None) -> dict:
+    headers = {'ETag': etag}
+    last_modified = to_http_datetime(last_modified)
+    if last_modified is not None:
+        headers['Last-Modified'] = last_modified.strftime('%a, %d %b %Y %H:%M:%S GMT')
+    return headers
+
+
+def is_not_modified(request: web.Request, etag: str, last_modified: datetime.datetime | float | None) -> bool:
+    """Совпадает ли представление у клиента с текущим. If-None-Match важнее If-Modified-Since."""
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match is not None:
+        tags = [tag.strip() for tag in if_none_match.split(',')]
+        # Для GET сравнение слабое: W/"x" совпадает с "x".
+        return '*' in tags or etag in tags or f'W/{etag}' in tags
+    if_modified_since = request.if_modified_since
+    last_modified = to_http_datetime(last_modified)
+    if if_modified_since is not None and last_modified is not None:
+        return last_modified.replace(microsecond=0) <= if_modified_since
+    return False
+
+
+def not_modified(etag: str, last_modified: datetime.datetime | float | None) -> web.Response:
+    return web.Response(status=304, headers=validator_headers(etag, last_modified))
@@ -0,0 +1,96 @@
+"""Счетчики просмотров объявлений с отложенной записью.
+
+Просмотр только увеличивает счетчик в памяти процесса. Фоновая задача раз в
+VIEWS_FLUSH_INTERVAL секунд записывает накопленные приращения одним пакетным
+INSERT ... ON CONFLICT DO UPDATE, поэтому чтение объявления не превращается в запись.
+При плавной остановке несохраненные приращения записываются (см. server.orm_context)."""
+import asyncio
+import logging
+import os
+
+from sqlalchemy import select, values, column, Integer, BigInteger
+from sqlalchemy.dialects.postgresql import insert
+
+from models import Session, Ads, AdsViews
+
+logger = logging.getLogger(__name__)
+
+VIEWS_FLUSH_INTERVAL = float(os.getenv("VIEWS_FLUSH_INTERVAL", 5))  # Период записи счетчиков, секунды.
+VIEWS_FLUSH_CHUNK_SIZE = int(os.getenv("VIEWS_FLUSH_CHUNK_SIZE", 1000))  # Объявлений в одном INSERT.
+
+
+class ViewCounter:
+
+    def __init__(self):
+        self.pending: dict[int, int] = {}  # ads_id -> просмотры, еще не записанные в базу.
+        self.flushed_views = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+        self._lock = asyncio.Lock()  # Фоновая и финальная запись не должны идти одновременно.
+
+    def hit(self, ads_id: int):
+        self.pending[ads_id] = self.pending.get(ads_id, 0) + 1
+
+    def pending_views(self, ads_id: int) -> int:
+        return self.pending.get(ads_id, 0)
+
+    def forget(self, ads_id: int):
+        """Объявление удалено: его просмотры записывать некуда."""
+        self.pending.pop(ads_id, None)
+
+    async def flush(self):
+        """Записывает накопленные приращения. При ошибке они возвращаются в pending до следующей попытки."""
+        async with self._lock:
+            if not self.pending:
+                return
+            batch, self.pending = self.pending, {}
+            rows = sorted(batch.items())  # Один порядок блокировок строк во всех воркерах - без взаимоблокировок.
+            committed = False
+            try:
+                async with Session() as session:
+                    for start in range(0, len(rows), VIEWS_FLUSH_CHUNK_SIZE):
+                        await session.execute(upsert_views(rows[start:start + VIEWS_FLUSH_CHUNK_SIZE]))
+                    await session.commit()
+                    committed = True
+            except BaseException as e:
+                if committed:  # Отмена при закрытии сессии: приращения уже в базе.
+                    raise
+                for ads_id, delta in batch.items():
+                    self.pending[ads_id] = self.pending.get(ads_id, 0) + delta
+                if isinstance(e, Exception):
+                    self.failed_flushes += 1
+                    logger.exception("failed to flush views of %s ads", len(rows))
+                    return
+                raise
+            self.flushes += 1
+            self.flushed_views += sum(batch.values())
+
+    async def run(self, interval: float = VIEWS_FLUSH_INTERVAL):
+        while True:
+            await asyncio.sleep(interval)
+            await self.flush()
+
+    def stats(self) -> dict:
+        return {
+            "pending_ads": len(self.pending),
+            "pending_views": sum(self.pending.values()),
+            "flushed_views": self.flushed_views,
+            "flushes": self.flushes,
+            "failed_flushes": self.failed_flushes,
+        }
+
+
+def upsert_views(rows: list[tuple[int, int]]):
+    """INSERT ... SELECT FROM (VALUES ...) ON CONFLICT: прибавляет приращения к сохраненным просмотрам.
+
+    Соединение с app_ads отбрасывает объявления, удаленные после просмотра."""
+    deltas = values(column('ads_id', Integer), column('delta', BigInteger), name='deltas').data(rows)
+    source = (select(deltas.c.ads_id, deltas.c.delta)
+              .join(Ads, Ads.ads_id == deltas.c.ads_id)
+              .order_by(deltas.c.ads_id))
+    stmt = insert(AdsViews).from_select(['ads_id', 'views'], source)
+    return stmt.on_conflict_do_update(index_elements=[AdsViews.ads_id],
+                                      set_={'views': AdsViews.views + stmt.excluded.views})
+
+
+view_counter = ViewCounter()
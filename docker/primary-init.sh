@@ -0,0 +1,3 @@
+#!/bin/sh
+# Разрешает подключения для потоковой репликации (сервис db-replica в docker-compose.yml).
+echo "host replication all all scram-sha-256" >> "$PGDATA/pg_hba.conf"
@@ -0,0 +1,14 @@
+#!/bin/sh
+# Реплика для чтения: при первом запуске копирует основную базу (pg_basebackup -R создает
+# standby.signal и primary_conninfo) и запускается в режиме горячего резерва.
+set -e
+export PGDATA=/var/lib/postgresql/data
+export PGPASSWORD="$POSTGRES_PASSWORD"
+
+if [ ! -s "$PGDATA/PG_VERSION" ]; then
+  until pg_isready -h "$PRIMARY_HOST" -p 5432 -U "$POSTGRES_USER"; do sleep 1; done
+  pg_basebackup -h "$PRIMARY_HOST" -p 5432 -U "$POSTGRES_USER" -D "$PGDATA" -R -X stream
+  chown -R postgres:postgres "$PGDATA"
+  chmod 700 "$PGDATA"
+fi
+exec su-exec postgres postgres -c hot_standby=on
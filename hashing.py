@@ -0,0 +1,166 @@
+import asyncio
+import os
+import secrets
+import time
+from contextlib import contextmanager
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+
+import bcrypt  # Для безопасного хеширования паролей.
+from aiohttp import web
+
+
+# Настройки пула хеширования берутся из переменных окружения.
+HASH_EXECUTOR = os.getenv("HASH_EXECUTOR", "thread")  # "thread" или "process".
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", os.cpu_count() or 1))  # Размер пула.
+HASH_ROUNDS = int(os.getenv("HASH_ROUNDS", 12))  # Фактор стоимости bcrypt (log2 числа раундов).
+HASH_QUEUE_SIZE = int(os.getenv("HASH_QUEUE_SIZE", 64))  # Сколько задач может ждать свободного воркера.
+HASH_RETRY_AFTER = int(os.getenv("HASH_RETRY_AFTER", 1))  # Значение заголовка Retry-After при перегрузке.
+
+
+def hash_password(password: str, rounds: int = HASH_ROUNDS) -> str:
+    """Функция для хеширования паролей."""
+    password = password.encode()  # Преобразуется в байтовую последовательность. Это необходимо для работы с bcrypt
+    password = bcrypt.hashpw(password, bcrypt.gensalt(rounds))  # Возвращает хеш-пароля в виде байтовой последовательности.
+    password = password.decode()  # Декодирование хеша в строковый формат для удобства использования результата.
+    return password
+
+
+def check_password(pasword: str, hashed_password: str) -> bool:
+    """Для авторизации. Возвращает булевое значение True или False"""
+    password = pasword.encode()
+    hashed_password = hashed_password.encode()
+    return bcrypt.checkpw(password, hashed_password)
+
+
+class PasswordHasher:
+    """Выполняет bcrypt в отдельном пуле, чтобы не блокировать цикл событий aiohttp.
+
+    Очередь ограничена: если все воркеры заняты и в ожидании уже queue_size задач,
+    новый запрос сразу получает 503 вместо того, чтобы копить бесконечный хвост."""
+
+    def __init__(self, kind: str = "thread", workers: int = 1, rounds: int = 12, queue_size: int = 64):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"Неизвестный тип пула: {kind}")
+        self.kind = kind
+        self.workers = workers
+        self.rounds = rounds
+        self.queue_size = queue_size
+        self._executor: Executor | None = None  # Пул создается лениво при первом обращении.
+        self._in_flight = 0  # Задачи, которые выполняются или ждут в очереди пула.
+        self._dummy_hash: str | None = None  # Хеш случайного пароля для check_missing, создается при старте.
+        # Статистика для подбора размера пула.
+        self.completed = 0
+        self.rejected = 0
+        self.max_queue_depth = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    @classmethod
+    def from_env(cls) -> "PasswordHasher":
+        return cls(kind=HASH_EXECUTOR, workers=HASH_WORKERS, rounds=HASH_ROUNDS, queue_size=HASH_QUEUE_SIZE)
+
+    @property
+    def executor(self) -> Executor:
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+        return self._executor
+
+    @property
+    def queue_depth(self) -> int:
+        """Сколько задач ждут свободного воркера."""
+        return max(self._in_flight - self.workers, 0)
+
+    @contextmanager
+    def _admit(self, count: int = 1):
+        """Резервирует count мест в очереди или отвечает 503, если пул перегружен.
+
+        Места освобождаются при выходе из блока, в том числе если запрос отменен
+        до того, как задачи хеширования успели запуститься."""
+        if self._in_flight + count > self.workers + self.queue_size:
+            self.rejected += count
+            raise web.HTTPServiceUnavailable(
+                text='{"error": "Password hashing is overloaded, try again later"}',
+                content_type='application/json',
+                headers={"Retry-After": str(HASH_RETRY_AFTER)},
+            )
+        self._in_flight += count
+        self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+        try:
+            yield
+        finally:
+            self._in_flight -= count
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        try:
+            return await loop.run_in_executor(self.executor, func, *args)
+        finally:
+            latency = time.perf_counter() - start  # Время с учетом ожидания в очереди пула.
+            self.completed += 1
+            self.total_latency += latency
+            self.max_latency = max(self.max_latency, latency)
+
+    async def hash(self, password: str) -> str:
+        """Асинхронно хеширует пароль."""
+        with self._admit():
+            return await self._run(hash_password, password, self.rounds)
+
+    async def hash_many(self, passwords: list[str]) -> list[str]:
+        """Хеширует пачку паролей параллельно на всех воркерах.
+
+        Пароли отправляются в пул окнами по числу воркеров, поэтому большая пачка
+        не занимает всю очередь и не вытесняет одиночные регистрации."""
+        hashed = []
+        for start in range(0, len(passwords), self.workers):
+            window = passwords[start:start + self.workers]
+            with self._admit(len(window)):
+                hashed.extend(await asyncio.gather(*(self._run(hash_password, p, self.rounds) for p in window)))
+        return hashed
+
+    async def check(self, password: str, hashed_password: str) -> bool:
+        """Асинхронно проверяет пароль."""
+        with self._admit():
+            return await self._run(check_password, password, hashed_password)
+
+    async def check_missing(self, password: str) -> bool:
+        """Проверка пароля несуществующего пользователя: всегда False, но за то же время,
+        что и настоящая, - по времени ответа нельзя узнать, есть ли такой пользователь."""
+        if self._dummy_hash is None:
+            self._dummy_hash = await self.hash(secrets.token_urlsafe(16))
+        await self.check(password, self._dummy_hash)
+        return False
+
+    def stats(self) -> dict:
+        """Глубина очереди и задержки хеширования."""
+        return {
+            "executor": self.kind,
+            "workers": self.workers,
+            "rounds": self.rounds,
+            "queue_size": self.queue_size,
+            "in_flight": self._in_flight,
+            "queue_depth": self.queue_depth,
+            "max_queue_depth": self.max_queue_depth,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "avg_latency_ms": round(self.total_latency / self.completed * 1000, 3) if self.completed else 0.0,
+            "max_latency_ms": round(self.max_latency * 1000, 3),
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+hasher = PasswordHasher.from_env()
+
+
+async def hasher_context(app):
+    """Готовит хеш для check_missing при старте и останавливает пул хеширования при завершении."""
+    await hasher.check_missing('')
+    yield
+    hasher.shutdown()
@@ -0,0 +1,198 @@
+"""Запуск сервера в несколько процессов (pre-fork).
+
+Главный процесс только следит за воркерами: каждый воркер - отдельный процесс со своим
+циклом событий, своим приложением из фабрики и своим движком базы данных.
+Входящие соединения распределяет ядро: воркеры слушают один порт через SO_REUSEPORT
+(или, с --no-reuse-port, принимают соединения из общего сокета, открытого до fork).
+
+Сигналы главному процессу:
+    SIGTERM, SIGINT - плавная остановка: воркеры дообрабатывают начатые запросы и выходят;
+    SIGHUP          - поочередный перезапуск воркеров без остановки приема соединений.
+Упавший воркер перезапускается автоматически.
+
+python server.py --workers 4 --port 8080"""
+import argparse
+import logging
+import os
+import signal
+import socket
+import time
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+WEB_HOST = os.getenv("WEB_HOST", "0.0.0.0")
+WEB_PORT = int(os.getenv("WEB_PORT", 8080))
+WEB_WORKERS = int(os.getenv("WEB_WORKERS", 1))  # 0 - по числу ядер.
+WEB_SHUTDOWN_TIMEOUT = float(os.getenv("WEB_SHUTDOWN_TIMEOUT", 30))  # Сколько ждать начатые запросы при остановке.
+RESTART_DELAY = 1.0  # Пауза перед перезапуском упавшего воркера, секунды.
+
+
+class Supervisor:
+    """Главный процесс: запускает воркеры, перезапускает упавшие, передает им сигналы."""
+
+    def __init__(self, app_factory, host: str, port: int, workers: int, reuse_port: bool, shutdown_timeout: float):
+        self.app_factory = app_factory
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.reuse_port = reuse_port
+        self.shutdown_timeout = shutdown_timeout
+        self.sock: socket.socket | None = None
+        self.children: dict[int, int] = {}  # pid -> номер воркера.
+        self.stopping = False
+        self.reload_requested = False
+
+    def open_shared_socket(self):
+        """Общий слушающий сокет, который воркеры наследуют при fork."""
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((self.host, self.port))
+        self.sock.listen(1024)
+        self.sock.set_inheritable(True)
+
+    def spawn(self, number: int) -> int:
+        pid = os.fork()
+        if pid == 0:  # Дочерний процесс.
+            code = 0
+            try:
+                for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP, signal.SIGCHLD):
+                    signal.signal(sig, signal.SIG_DFL)
+                self.run_worker(number)
+            except BaseException:
+                logger.exception("worker %s crashed", number)
+                code = 1
+            finally:
+                os._exit(code)
+        self.children[pid] = number
+        logger.info("worker %s started, pid %s", number, pid)
+        return pid
+
+    def run_worker(self, number: int):
+        app = self.app_factory(self.workers, number)
+        if self.sock is not None:
+            web.run_app(app, sock=self.sock, shutdown_timeout=self.shutdown_timeout, print=None)
+        else:
+            web.run_app(app, host=self.host, port=self.port, reuse_port=True,
+                        shutdown_timeout=self.shutdown_timeout, print=None)
+
+    def stop_children(self, pids=None):
+        for pid in list(pids if pids is not None else self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)  # aiohttp закрывает прием и дожидается начатых запросов.
+            except ProcessLookupError:
+                pass
+
+    def reap(self, block: bool = False) -> list[tuple[int, int]]:
+        """Собирает завершившиеся воркеры: список (pid, номер)."""
+        exited = []
+        while self.children:
+            try:
+                pid, status = os.waitpid(-1, 0 if block else os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                break
+            number = self.children.pop(pid, None)
+            if number is not None:
+                exited.append((pid, number))
+                logger.info("worker %s (pid %s) exited with status %s", number, pid, os.waitstatus_to_exitcode(status))
+            if block:
+                break
+        return exited
+
+    def rolling_restart(self) -> list[tuple[int, int]]:
+        """Поочередно заменяет воркеры: новый запускается до остановки старого.
+
+        Старый воркер останавливается, только если новый проработал RESTART_DELAY секунд;
+        если новый упал при старте, перезапуск прерывается и старые воркеры продолжают работу.
+        Возвращает воркеры, упавшие за время перезапуска, которых нужно запустить заново."""
+        exited = []
+        for pid, number in list(self.children.items()):
+            if self.stopping:
+                break
+            if pid not in self.children:  # Упал, пока заменялись предыдущие.
+                continue
+            new_pid = self.spawn(number)
+            time.sleep(RESTART_DELAY)
+            exited.extend(self.reap())
+            if new_pid not in self.children:
+                logger.error("worker %s failed to start, rolling restart aborted", number)
+                break
+            self.stop_children([pid])
+            deadline = time.monotonic() + self.shutdown_timeout + 5
+            while pid in self.children and time.monotonic() < deadline:
+                exited.extend(self.reap())
+                time.sleep(0.1)
+        # Остановленные старые воркеры и неудачные замены не перезапускаем: их номер уже занят.
+        running = set(self.children.values())
+        return [(pid, number) for pid, number in exited if number not in running]
+
+    def run(self):
+        if not self.reuse_port:
+            self.open_shared_socket()
+        signal.signal(signal.SIGTERM, self.handle_stop)
+        signal.signal(signal.SIGINT, self.handle_stop)
+        signal.signal(signal.SIGHUP, self.handle_reload)
+        logger.info("listening on %s:%s with %s workers", self.host, self.port, self.workers)
+        for number in range(self.workers):
+            self.spawn(number)
+
+        while not self.stopping:
+            exited = []
+            if self.reload_requested:
+                self.reload_requested = False
+                exited = self.rolling_restart()
+            for _, number in exited + self.reap():
+                if not self.stopping:
+                    time.sleep(RESTART_DELAY)  # Не перезапускать в цикле воркер, который падает при старте.
+                    self.spawn(number)
+            time.sleep(0.2)
+
+        self.stop_children()
+        deadline = time.monotonic() + self.shutdown_timeout + 5
+        while self.children and time.monotonic() < deadline:
+            self.reap()
+            time.sleep(0.1)
+        for pid in self.children:  # Не успели за отведенное время.
+            os.kill(pid, signal.SIGKILL)
+        logger.info("stopped")
+
+    def handle_stop(self, signum, frame):
+        self.stopping = True
+
+    def handle_reload(self, signum, frame):
+        self.reload_requested = True
+
+
+def serve(app_factory, host: str = WEB_HOST, port: int = WEB_PORT, workers: int = WEB_WORKERS,
+          reuse_port: bool = True, shutdown_timeout: float = WEB_SHUTDOWN_TIMEOUT):
+    """Запускает приложение из app_factory(workers, номер воркера) в одном или нескольких процессах."""
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        web.run_app(app_factory(1, 0), host=host, port=port, shutdown_timeout=shutdown_timeout)
+        return
+    Supervisor(app_factory, host, port, workers, reuse_port, shutdown_timeout).run()
+
+
+def main(app_factory=None):
+    parser = argparse.ArgumentParser(description="Запуск REST API объявлений.")
+    parser.add_argument("--host", default=WEB_HOST)
+    parser.add_argument("--port", type=int, default=WEB_PORT)
+    parser.add_argument("--workers", type=int, default=WEB_WORKERS, help="число процессов, 0 - по числу ядер")
+    parser.add_argument("--no-reuse-port", dest="reuse_port", action="store_false",
+                        help="общий сокет, открытый до fork, вместо SO_REUSEPORT")
+    parser.add_argument("--shutdown-timeout", type=float, default=WEB_SHUTDOWN_TIMEOUT)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"),
+                        format="%(asctime)s %(process)d %(levelname)s %(name)s: %(message)s")
+    if app_factory is None:
+        from server import create_app
+        app_factory = create_app
+    serve(app_factory, args.host, args.port, args.workers, args.reuse_port, args.shutdown_timeout)
+
+
+if __name__ == "__main__":
+    main()
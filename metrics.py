@@ -0,0 +1,282 @@
+"""Метрики в формате Prometheus и выборочное логирование.
+
+Счетчики и гистограммы хранятся в памяти процесса, запись стоит один bisect и пару
+сложений, поэтому их можно держать включенными под полной нагрузкой.
+Снимок отдается маршрутом /metrics.
+
+Каждый процесс-воркер считает только свои запросы, и все его серии помечены меткой worker.
+Через общий порт /metrics отвечает случайный воркер, поэтому при нескольких воркерах
+Prometheus должен опрашивать каждый: с METRICS_PORT воркер N отдает /metrics
+на отдельном порту METRICS_PORT + N."""
+import bisect
+import logging
+import os
+import random
+import time
+
+from aiohttp import web
+from sqlalchemy import event
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", 0.01))  # Доля записей горячего пути, попадающих в лог.
+METRICS_HOST = os.getenv("METRICS_HOST", "0.0.0.0")
+METRICS_PORT = int(os.getenv("METRICS_PORT", 0))  # Порт /metrics воркера 0, воркер N - METRICS_PORT + N; 0 - нет.
+
+# Границы корзин по умолчанию, секунды.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (100, 500, 1000, 5000, 10000, 50000, 100000, 500000, 1000000, 10000000)
+
+
+def _format_labels(labelnames: tuple, values: tuple, *extra: str) -> str:
+    parts = [f'{name}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+             for name, value in zip(labelnames, values)]
+    parts.extend(part for part in extra if part)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: dict[tuple, float] = {}
+
+    def header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    def render(self, const: str = "") -> list[str]:
+        """const - общие метки процесса (см. Registry.set_const_labels)."""
+        lines = self.header()
+        for labels, value in self._values.items():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels, const)} {value}")
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def inc(self, *labels, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) - amount
+
+    def set(self, *labels, value: float):
+        self._values[labels] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+        self._series: dict[tuple, list] = {}  # labels -> [счетчики по корзинам..., сумма, количество]
+
+    def observe(self, value: float, *labels):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self, const: str = "") -> list[str]:
+        lines = self.header()
+        for labels, series in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series):
+                cumulative += count
+                le = _format_labels(self.labelnames, labels, const, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            plain = _format_labels(self.labelnames, labels, const)
+            lines.append(f"{self.name}_sum{plain} {series[-2]}")
+            lines.append(f"{self.name}_count{plain} {series[-1]}")
+        return lines
+
+
+class StatsGauges(Metric):
+    """Числовые поля словаря stats() как отдельные gauge-метрики prefix_<поле>."""
+    kind = "gauge"
+
+    def __init__(self, prefix: str, documentation: str, stats):
+        super().__init__(prefix, documentation)
+        self.stats = stats
+
+    def render(self, const: str = "") -> list[str]:
+        lines = []
+        labels = _format_labels((), (), const)
+        for field, value in self.stats().items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            name = f"{self.name}_{field}"
+            lines += [f"# HELP {name} {self.documentation}: {field}.", f"# TYPE {name} gauge", f"{name}{labels} {value}"]
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: list[Metric] = []
+        self.collectors = []  # Функции, обновляющие метрики перед выдачей снимка.
+        self.const_labels = ""  # Метки всех серий процесса, уже в формате name="value".
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def register_stats(self, prefix: str, documentation: str, stats):
+        """Выгружает статистику компонента (пул хеширования, кэш...) без отдельных счетчиков."""
+        return self.register(StatsGauges(prefix, documentation, stats))
+
+    def set_const_labels(self, **labels):
+        """Метки, которые добавляются ко всем сериям процесса (например, номер воркера)."""
+        self.const_labels = _format_labels(tuple(labels), tuple(labels.values()))[1:-1]
+
+    def add_collector(self, collector):
+        self.collectors.append(collector)
+
+    def render(self) -> str:
+        for collector in self.collectors:
+            collector()
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render(self.const_labels))
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_requests = registry.register(Counter(
+    "http_requests_total", "HTTP requests by route, method and status.", ("route", "method", "status")))
+http_latency = registry.register(Histogram(
+    "http_request_duration_seconds", "HTTP request latency.", ("route", "method")))
+http_response_size = registry.register(Histogram(
+    "http_response_size_bytes", "HTTP response body size.", ("route", "method"), buckets=SIZE_BUCKETS))
+http_in_flight = registry.register(Gauge(
+    "http_requests_in_flight", "Requests currently being handled."))
+db_query_latency = registry.register(Histogram(
+    "db_query_duration_seconds", "Database statement execution time.", ("statement",)))
+db_pool_wait = registry.register(Histogram(
+    "db_pool_checkout_wait_seconds", "Time spent waiting for a pooled connection."))
+db_pool_checked_out = registry.register(Gauge(
+    "db_pool_checked_out", "Connections currently checked out of the pool."))
+
+
+def route_name(request: web.Request) -> str:
+    """Шаблон маршрута ('/ads/{ads_id}'), чтобы число серий не зависело от идентификаторов."""
+    route = request.match_info.route
+    resource = route.resource if route is not None else None
+    return resource.canonical if resource is not None else "unmatched"
+
+
+@web.middleware
+async def metrics_middleware(request: web.Request, handler):
+    """Задержка, размер ответа и число обрабатываемых запросов по маршрутам."""
+    route, method = route_name(request), request.method
+    http_in_flight.inc()
+    start = time.perf_counter()
+    status, size = 500, 0
+    try:
+        response = await handler(request)
+        status = response.status
+        size = response.content_length if response.content_length is not None else response.body_length
+        return response
+    except web.HTTPException as e:
+        status = e.status
+        raise
+    finally:
+        http_in_flight.dec()
+        http_latency.observe(time.perf_counter() - start, route, method)
+        http_response_size.observe(size or 0, route, method)
+        http_requests.inc(route, method, status)
+
+
+class TimedAsyncPool(AsyncAdaptedQueuePool):
+    """Пул соединений, замеряющий ожидание свободного соединения."""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            db_pool_wait.observe(time.perf_counter() - start)
+
+
+# SQLAlchemy пишет события пула в логгер по имени класса; как и для его собственных пулов, только предупреждения.
+logging.getLogger(f"{__name__}.{TimedAsyncPool.__name__}").setLevel(logging.WARNING)
+
+
+_engines = []  # Инструментированные движки для db_pool_checked_out.
+
+
+def instrument_engine(engine):
+    """Подключает замер времени запросов к движку SQLAlchemy."""
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context._query_start = time.perf_counter()
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        # Метка - первое слово запроса (SELECT, INSERT...), чтобы не плодить серии.
+        kind = statement.lstrip().split(None, 1)[0].upper() if statement else "UNKNOWN"
+        db_query_latency.observe(time.perf_counter() - context._query_start, kind)
+
+    _engines.append(engine)
+
+
+def collect_pools():
+    db_pool_checked_out.set(value=sum(engine.pool.checkedout() for engine in _engines))
+
+
+registry.add_collector(collect_pools)
+
+
+async def metrics_handler(request: web.Request):
+    """Снимок метрик в текстовом формате Prometheus."""
+    return web.Response(body=registry.render().encode(),
+                        headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+
+def metrics_server(port: int, host: str = METRICS_HOST):
+    """cleanup_ctx для отдельного порта /metrics текущего воркера.
+
+    SO_REUSEPORT позволяет новому воркеру занять порт, пока старый дообрабатывает запросы при SIGHUP."""
+    async def metrics_server_context(app):
+        metrics_app = web.Application()
+        metrics_app.router.add_get('/metrics', metrics_handler)
+        runner = web.AppRunner(metrics_app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, host, port, reuse_port=True).start()
+        yield
+        await runner.cleanup()
+    return metrics_server_context
+
+
+class SamplingFilter(logging.Filter):
+    """Пропускает в лог только долю rate записей, чтобы горячий путь не тормозил на логировании."""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return random.random() < self.rate
+
+
+def get_sampled_logger(name: str, rate: float = LOG_SAMPLE_RATE) -> logging.Logger:
+    """Логгер для горячего пути: пишет примерно rate от всех записей."""
+    logger = logging.getLogger(f"{name}.sampled")
+    if not any(isinstance(f, SamplingFilter) for f in logger.filters):
+        logger.addFilter(SamplingFilter(rate))
+    return logger
@@ -0,0 +1,125 @@
+"""Версионные миграции схемы базы данных.
+
+Каждая миграция - файл versions/NNNN_name.py со списками SQL-команд UP и DOWN.
+Примененная версия хранится в таблице schema_migrations. Сервер при старте только
+проверяет, что база на последней версии; применять миграции нужно командой
+python -m migrations upgrade."""
+import importlib.util
+import re
+from dataclasses import dataclass
+from pathlib import Path
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncConnection
+
+VERSIONS_DIR = Path(__file__).parent / "versions"
+VERSION_FILE_RE = re.compile(r"^(\d{4})_(\w+)\.py$")
+STATE_TABLE = "schema_migrations"
+
+
+@dataclass
+class Migration:
+    version: int
+    name: str
+    description: str
+    up: list[str]
+    down: list[str]
+
+
+class SchemaVersionError(RuntimeError):
+    """Версия схемы в базе не совпадает с последней миграцией."""
+
+
+def load_migrations() -> list[Migration]:
+    """Загружает миграции из каталога versions в порядке версий."""
+    migrations = []
+    for path in sorted(VERSIONS_DIR.iterdir()):
+        match = VERSION_FILE_RE.match(path.name)
+        if match is None:
+            continue
+        spec = importlib.util.spec_from_file_location(f"migrations.versions.m{match[1]}", path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        migrations.append(Migration(
+            version=int(match[1]),
+            name=match[2],
+            description=(module.__doc__ or "").strip(),
+            up=list(module.UP),
+            down=list(module.DOWN),
+        ))
+    versions = [migration.version for migration in migrations]
+    if versions != list(range(1, len(versions) + 1)):
+        raise RuntimeError(f"Номера миграций должны идти подряд с 1, найдено: {versions}")
+    return migrations
+
+
+def head_version() -> int:
+    """Версия последней миграции."""
+    migrations = load_migrations()
+    return migrations[-1].version if migrations else 0
+
+
+async def ensure_state_table(conn: AsyncConnection):
+    await conn.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {STATE_TABLE} ("
+        f"version INTEGER PRIMARY KEY, "
+        f"name VARCHAR(128) NOT NULL, "
+        f"applied_at TIMESTAMP NOT NULL DEFAULT now())"
+    ))
+
+
+async def current_version(conn: AsyncConnection) -> int:
+    """Текущая версия схемы; 0, если миграции еще не применялись."""
+    exists = await conn.scalar(text(f"SELECT to_regclass('{STATE_TABLE}') IS NOT NULL"))
+    if not exists:
+        return 0
+    return await conn.scalar(text(f"SELECT coalesce(max(version), 0) FROM {STATE_TABLE}"))
+
+
+async def upgrade(engine: AsyncEngine, target: int | None = None) -> list[Migration]:
+    """Применяет миграции до версии target (по умолчанию - до последней).
+
+    Каждая миграция выполняется в своей транзакции вместе с записью в schema_migrations."""
+    applied = []
+    migrations = load_migrations()
+    if target is None:
+        target = migrations[-1].version if migrations else 0
+    async with engine.begin() as conn:
+        await ensure_state_table(conn)
+        version = await current_version(conn)
+    for migration in migrations:
+        if version < migration.version <= target:
+            async with engine.begin() as conn:
+                for statement in migration.up:
+                    await conn.execute(text(statement))
+                await conn.execute(text(f"INSERT INTO {STATE_TABLE} (version, name) VALUES (:version, :name)"),
+                                   {"version": migration.version, "name": migration.name})
+            applied.append(migration)
+    return applied
+
+
+async def downgrade(engine: AsyncEngine, target: int) -> list[Migration]:
+    """Откатывает миграции, пока версия схемы не станет равна target."""
+    reverted = []
+    async with engine.begin() as conn:
+        version = await current_version(conn)
+    for migration in reversed(load_migrations()):
+        if target < migration.version <= version:
+            async with engine.begin() as conn:
+                for statement in migration.down:
+                    await conn.execute(text(statement))
+                await conn.execute(text(f"DELETE FROM {STATE_TABLE} WHERE version = :version"),
+                                   {"version": migration.version})
+            reverted.append(migration)
+    return reverted
+
+
+async def verify(engine: AsyncEngine):
+    """Проверка при старте сервера: схема должна быть на последней версии."""
+    expected = head_version()
+    async with engine.connect() as conn:
+        version = await current_version(conn)
+    if version != expected:
+        raise SchemaVersionError(
+            f"Версия схемы {version}, ожидается {expected}. Выполните: python -m migrations upgrade"
+        )
@@ -0,0 +1,45 @@
+"""Командная строка миграций.
+
+python -m migrations upgrade [версия]   применить миграции (по умолчанию - все)
+python -m migrations downgrade версия   откатить до указанной версии (0 - все)
+python -m migrations current            текущая версия схемы
+python -m migrations history            список миграций"""
+import argparse
+import asyncio
+
+from migrations import load_migrations, upgrade, downgrade, current_version, head_version
+
+
+async def main(args):
+    from models import init_engine  # Импорт здесь: история миграций не требует подключения к базе.
+    engine = init_engine()
+    try:
+        if args.command == "upgrade":
+            for migration in await upgrade(engine, args.version):
+                print(f"applied  {migration.version:04d} {migration.name}")
+        elif args.command == "downgrade":
+            for migration in await downgrade(engine, args.version):
+                print(f"reverted {migration.version:04d} {migration.name}")
+        elif args.command == "current":
+            async with engine.connect() as conn:
+                print(f"current {await current_version(conn)}, head {head_version()}")
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="python -m migrations", description="Миграции схемы базы данных.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    upgrade_parser = commands.add_parser("upgrade", help="применить миграции")
+    upgrade_parser.add_argument("version", type=int, nargs="?", default=None)
+    downgrade_parser = commands.add_parser("downgrade", help="откатить миграции до версии")
+    downgrade_parser.add_argument("version", type=int)
+    commands.add_parser("current", help="текущая версия схемы")
+    commands.add_parser("history", help="список миграций")
+    args = parser.parse_args()
+
+    if args.command == "history":
+        for migration in load_migrations():
+            print(f"{migration.version:04d} {migration.name}: {migration.description}")
+    else:
+        asyncio.run(main(args))
@@ -0,0 +1,27 @@
+"""Исходные таблицы пользователей и объявлений (раньше создавались через create_all)."""
+
+# IF NOT EXISTS: базы, созданные старым create_all, принимают эту миграцию без изменений.
+UP = [
+    """
+    CREATE TABLE IF NOT EXISTS app_users (
+        id SERIAL PRIMARY KEY,
+        name VARCHAR(64) NOT NULL UNIQUE,
+        password VARCHAR(72) NOT NULL,
+        registration_time TIMESTAMP WITHOUT TIME ZONE DEFAULT now()
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS app_ads (
+        ads_id SERIAL PRIMARY KEY,
+        title VARCHAR(64) NOT NULL UNIQUE,
+        description VARCHAR(384) NOT NULL,
+        registration_time TIMESTAMP WITHOUT TIME ZONE DEFAULT now(),
+        owner_id INTEGER NOT NULL REFERENCES app_users (id)
+    )
+    """,
+]
+
+DOWN = [
+    "DROP TABLE IF EXISTS app_ads",
+    "DROP TABLE IF EXISTS app_users",
+]
@@ -0,0 +1,18 @@
+"""Индексы для объявлений пользователя и полнотекстового поиска."""
+
+UP = [
+    # get_all_ads_for_user и выгрузка /ads/user/{user_id}: без индекса - последовательное чтение app_ads.
+    "CREATE INDEX IF NOT EXISTS ix_app_ads_owner_id_registration_time ON app_ads (owner_id, registration_time)",
+    # /ads/search; выражение совпадает с models.ADS_SEARCH_DOCUMENT.
+    """
+    CREATE INDEX IF NOT EXISTS ix_app_ads_search ON app_ads USING gin ((
+        setweight(to_tsvector('simple'::regconfig, title), 'A') ||
+        setweight(to_tsvector('simple'::regconfig, description), 'B')
+    ))
+    """,
+]
+
+DOWN = [
+    "DROP INDEX IF EXISTS ix_app_ads_search",
+    "DROP INDEX IF EXISTS ix_app_ads_owner_id_registration_time",
+]
@@ -0,0 +1,18 @@
+"""Версия строки и время изменения для ETag/Last-Modified пользователей и объявлений."""
+
+UP = [
+    "ALTER TABLE app_users ADD COLUMN version INTEGER NOT NULL DEFAULT 1",
+    "ALTER TABLE app_users ADD COLUMN updated_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT timezone('utc', now())",
+    "ALTER TABLE app_ads ADD COLUMN version INTEGER NOT NULL DEFAULT 1",
+    "ALTER TABLE app_ads ADD COLUMN updated_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT timezone('utc', now())",
+    # Проверка актуальности списка объявлений пользователя: count и max(updated_at) только по индексу.
+    "CREATE INDEX IF NOT EXISTS ix_app_ads_owner_id_updated_at ON app_ads (owner_id, updated_at)",
+]
+
+DOWN = [
+    "DROP INDEX IF EXISTS ix_app_ads_owner_id_updated_at",
+    "ALTER TABLE app_ads DROP COLUMN updated_at",
+    "ALTER TABLE app_ads DROP COLUMN version",
+    "ALTER TABLE app_users DROP COLUMN updated_at",
+    "ALTER TABLE app_users DROP COLUMN version",
+]
@@ -0,0 +1,16 @@
+"""Индексы ленты объявлений GET /ads: постраничный вывод по ключу (registration_time, ads_id)."""
+
+UP = [
+    # Лента без фильтра по владельцу, в том числе с диапазоном времени.
+    "CREATE INDEX IF NOT EXISTS ix_app_ads_registration_time_ads_id ON app_ads (registration_time, ads_id)",
+    # Лента одного владельца; заменяет (owner_id, registration_time): ads_id нужен для сортировки без досортировки.
+    "CREATE INDEX IF NOT EXISTS ix_app_ads_owner_id_registration_time_ads_id "
+    "ON app_ads (owner_id, registration_time, ads_id)",
+    "DROP INDEX IF EXISTS ix_app_ads_owner_id_registration_time",
+]
+
+DOWN = [
+    "CREATE INDEX IF NOT EXISTS ix_app_ads_owner_id_registration_time ON app_ads (owner_id, registration_time)",
+    "DROP INDEX IF EXISTS ix_app_ads_owner_id_registration_time_ads_id",
+    "DROP INDEX IF EXISTS ix_app_ads_registration_time_ads_id",
+]
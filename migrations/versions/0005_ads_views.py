@@ -0,0 +1,14 @@
+"""Счетчики просмотров объявлений (пишутся пакетами, см. counters.py)."""
+
+UP = [
+    """
+    CREATE TABLE IF NOT EXISTS app_ads_views (
+        ads_id INTEGER PRIMARY KEY REFERENCES app_ads (ads_id) ON DELETE CASCADE,
+        views BIGINT NOT NULL DEFAULT 0
+    )
+    """,
+]
+
+DOWN = [
+    "DROP TABLE IF EXISTS app_ads_views",
+]
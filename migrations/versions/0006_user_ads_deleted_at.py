@@ -0,0 +1,9 @@
+"""Время последнего удаления объявления пользователя: Last-Modified его списка объявлений."""
+
+UP = [
+    "ALTER TABLE app_users ADD COLUMN ads_deleted_at TIMESTAMP WITHOUT TIME ZONE",
+]
+
+DOWN = [
+    "ALTER TABLE app_users DROP COLUMN ads_deleted_at",
+]
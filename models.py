@@ -1,11 +1,15 @@
 import datetime
-from sqlalchemy import Integer, String, DateTime, func, ForeignKey
-from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncAttrs
+from sqlalchemy import Integer, BigInteger, String, DateTime, func, ForeignKey, Index, text
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncAttrs, AsyncEngine, AsyncSession
 from sqlalchemy.orm import DeclarativeBase, mapped_column, Mapped, relationship
 import os
 from dotenv import load_dotenv
+from serialization import AdsDTO, UserDTO
+from metrics import TimedAsyncPool, instrument_engine
+from replicas import replicas
+import logging
 load_dotenv()
-print("models")
+logger = logging.getLogger(__name__)
 
 
 # Получаем переменные окружения для настройки подключения к PostgreSQL.
@@ -14,14 +18,99 @@ POSTGRES_PASSWORD = os.getenv("POSTGRES_PASSWORD")
 POSTGRES_DB = os.getenv("POSTGRES_DB")
 POSTGRES_HOST = os.getenv("POSTGRES_HOST")
 POSTGRES_PORT = os.getenv("POSTGRES_PORT")
-print(f"получаем переменные окружения? - {POSTGRES_PORT}")
+# Реплики для чтения: "host:port,host:port", пользователь, пароль и база те же, что у основной.
+POSTGRES_REPLICA_HOSTS = [host.strip() for host in os.getenv("POSTGRES_REPLICA_HOSTS", "").split(",") if host.strip()]
+logger.debug("PostgreSQL %s:%s/%s", POSTGRES_HOST, POSTGRES_PORT, POSTGRES_DB)
 
-# Создаем строку подключения (DSN) для SQLAlchemy с использованием переменных окружения.
-engine = create_async_engine(f"postgresql+asyncpg://"
-                             f"{POSTGRES_USER}:{POSTGRES_PASSWORD}@"
-                             f"{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}")
+# Настройки пула соединений и драйвера asyncpg.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))  # Постоянные соединения в пуле.
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))  # Дополнительные соединения сверх пула при пиках.
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))  # Сколько ждать свободного соединения, секунды.
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))  # Пересоздавать соединения старше N секунд.
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "0") == "1"  # Проверять соединение перед выдачей из пула.
+DB_CONNECT_TIMEOUT = float(os.getenv("DB_CONNECT_TIMEOUT", 10))  # Таймаут установки соединения, секунды.
+DB_COMMAND_TIMEOUT = float(os.getenv("DB_COMMAND_TIMEOUT", 30))  # Таймаут одного запроса, секунды.
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", 256))  # Кэш подготовленных запросов на соединение.
 
-Session = async_sessionmaker(bind=engine, expire_on_commit=False)
+# Строка подключения (DSN) для SQLAlchemy из переменных окружения.
+def database_url(host: str, port) -> str:
+    return (f"postgresql+asyncpg://"
+            f"{POSTGRES_USER}:{POSTGRES_PASSWORD}@"
+            f"{host}:{port}/{POSTGRES_DB}"
+            f"?prepared_statement_cache_size={DB_STATEMENT_CACHE_SIZE}")
+
+
+def replica_url(address: str) -> str:
+    host, _, port = address.partition(":")
+    return database_url(host, port or 5432)
+
+
+DATABASE_URL = database_url(POSTGRES_HOST, POSTGRES_PORT)
+
+engine: AsyncEngine | None = None  # Создается init_engine: в каждом процессе-воркере свой.
+Session = async_sessionmaker(expire_on_commit=False)  # Привязывается к движку в init_engine.
+
+
+def init_engine(workers: int = 1) -> AsyncEngine:
+    """Создает движок текущего процесса и привязывает к нему Session.
+
+    DB_POOL_SIZE и DB_MAX_OVERFLOW - бюджет соединений на весь сервер (к каждой базе),
+    при нескольких воркерах он делится между ними поровну. Движки реплик передаются в replicas."""
+    global engine
+    if workers > DB_POOL_SIZE + DB_MAX_OVERFLOW:
+        # Воркеру нужно хотя бы одно соединение: бюджет превышен, всего будет по соединению на воркер.
+        logger.warning("%s workers exceed the connection budget DB_POOL_SIZE + DB_MAX_OVERFLOW = %s, "
+                       "each worker still opens one connection", workers, DB_POOL_SIZE + DB_MAX_OVERFLOW)
+    engine = create_engine(DATABASE_URL, workers)
+    Session.configure(bind=engine)
+    replicas.configure({address: create_engine(replica_url(address), workers) for address in POSTGRES_REPLICA_HOSTS},
+                       primary=engine)
+    return engine
+
+
+def pool_size(workers: int) -> int:
+    """Постоянных соединений на процесс-воркер."""
+    return max(1, DB_POOL_SIZE // workers)
+
+
+def pool_overflow(workers: int) -> int:
+    """Соединений сверх пула на воркер: вместе с pool_size - доля бюджета DB_POOL_SIZE + DB_MAX_OVERFLOW."""
+    return max(0, (DB_POOL_SIZE + DB_MAX_OVERFLOW) // workers - pool_size(workers))
+
+
+def pool_capacity(workers: int) -> int:
+    """Сколько соединений с основной базой может открыть один воркер, с учетом переполнения."""
+    return pool_size(workers) + pool_overflow(workers)
+
+
+def create_engine(url: str, workers: int) -> AsyncEngine:
+    new_engine = create_async_engine(url,
+                                     poolclass=TimedAsyncPool,  # Замеряет ожидание соединения из пула.
+                                     pool_size=pool_size(workers),
+                                     max_overflow=pool_overflow(workers),
+                                     pool_timeout=DB_POOL_TIMEOUT,
+                                     pool_recycle=DB_POOL_RECYCLE,
+                                     pool_pre_ping=DB_POOL_PRE_PING,
+                                     connect_args={"timeout": DB_CONNECT_TIMEOUT,
+                                                   "command_timeout": DB_COMMAND_TIMEOUT})
+    instrument_engine(new_engine)  # Время запросов для /metrics.
+    return new_engine
+
+
+def read_session(primary: bool = False) -> AsyncSession:
+    """Сессия только для чтения: на реплике, если есть здоровая, иначе (или при primary=True) на основной базе."""
+    replica = replicas.pick(primary)
+    return Session(bind=replica) if replica is not None else Session()
+
+
+# Документ полнотекстового поиска по объявлению: заголовок весит больше описания.
+# Запросы должны использовать ровно это выражение, иначе Postgres не применит GIN-индекс.
+ADS_SEARCH_DOCUMENT = ("(setweight(to_tsvector('simple'::regconfig, title), 'A') || "
+                       "setweight(to_tsvector('simple'::regconfig, description), 'B'))")
+
+
+# Текущее время в UTC для колонок updated_at.
+UTC_NOW = func.timezone('utc', func.now())
 
 
 # Формируем базовый класс.
@@ -29,27 +118,39 @@ class Base(DeclarativeBase,AsyncAttrs):
     pass
 
 
-# Определяем модели.
+# Определяем модели. Схема в базе меняется только миграциями (каталог migrations), модели должны им соответствовать.
 class Ads(Base):
     __tablename__ = "app_ads"
+    __table_args__ = (
+        # Объявления пользователя и лента GET /ads: постраничный вывод по (registration_time, ads_id).
+        Index('ix_app_ads_owner_id_registration_time_ads_id', 'owner_id', 'registration_time', 'ads_id'),
+        Index('ix_app_ads_registration_time_ads_id', 'registration_time', 'ads_id'),
+        Index('ix_app_ads_owner_id_updated_at', 'owner_id', 'updated_at'),  # Актуальность списка пользователя.
+        Index('ix_app_ads_search', text(ADS_SEARCH_DOCUMENT), postgresql_using='gin'),  # Для /ads/search.
+    )
 
     ads_id: Mapped[int] = mapped_column(Integer, primary_key=True)
     title: Mapped[str] = mapped_column(String(64), unique=True, nullable=False)
     description: Mapped[str] = mapped_column(String(384), nullable=False)  # Описание.
     registration_time: Mapped[datetime.datetime] = mapped_column(DateTime, server_default=func.now())
+    # Версия и время изменения (UTC) для ETag/Last-Modified, увеличиваются при каждом изменении.
+    version: Mapped[int] = mapped_column(Integer, nullable=False, server_default=text("1"))
+    updated_at: Mapped[datetime.datetime] = mapped_column(DateTime, nullable=False, server_default=UTC_NOW)
 
     owner_id: Mapped[int] = mapped_column(Integer, ForeignKey('app_users.id'), nullable=False)
     owner: Mapped['User'] = relationship('User', back_populates='ads')
 
     @property
     def json(self):
-        return {
-            "id": self.ads_id,  # Corrected from 'self.id'
-            "title": self.title,
-            "description": self.description,
-            "registration_time": self.registration_time.isoformat(),
-            "owner": self.owner_id
-        }
+        return AdsDTO.from_row(self).to_dict()  # Тот же формат, что и в ответах API.
+
+
+class AdsViews(Base):
+    """Сохраненное число просмотров объявления; новые просмотры копятся в памяти (counters.py)."""
+    __tablename__ = "app_ads_views"
+
+    ads_id: Mapped[int] = mapped_column(Integer, ForeignKey('app_ads.ads_id', ondelete='CASCADE'), primary_key=True)
+    views: Mapped[int] = mapped_column(BigInteger, nullable=False, server_default=text("0"))
 
 
 class User(Base):
@@ -59,15 +160,16 @@ class User(Base):
     name: Mapped[str] = mapped_column(String(64), unique=True, nullable=False)
     password: Mapped[str] = mapped_column(String(72), nullable=False)
     registration_time: Mapped[datetime.datetime] = mapped_column(DateTime, server_default=func.now())
+    # Версия и время изменения (UTC) для ETag/Last-Modified, увеличиваются при каждом изменении.
+    version: Mapped[int] = mapped_column(Integer, nullable=False, server_default=text("1"))
+    updated_at: Mapped[datetime.datetime] = mapped_column(DateTime, nullable=False, server_default=UTC_NOW)
+    # Когда удалено последнее объявление (UTC): удаление не сдвигает max(updated_at) списка объявлений.
+    ads_deleted_at: Mapped[datetime.datetime | None] = mapped_column(DateTime, nullable=True)
 
     ads: Mapped[list['Ads']] = relationship('Ads', back_populates='owner')
 
     # для создания специальных методов, которые можно вызывать как атрибуты объекта, а не как обычные методы
     @property
     def json(self):
-        return {
-            "id": self.id,
-            "name": self.name,
-            "registration_time": self.registration_time.isoformat()
-        }
+        return UserDTO.from_row(self).to_dict()  # Тот же формат, что и в ответах API.
 
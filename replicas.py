@@ -0,0 +1,184 @@
+"""Маршрутизация чтений на реплики PostgreSQL.
+
+Реплики задаются в POSTGRES_REPLICA_HOSTS (см. models.py). Чтения распределяются между
+здоровыми репликами по кругу (round_robin) или на наименее занятую (least_connections).
+Фоновая проверка раз в DB_REPLICA_CHECK_INTERVAL секунд выполняет запрос на каждой реплике
+и исключает недоступные и отставшие больше чем на DB_REPLICA_MAX_LAG секунд. Реплика считается
+догнавшей основную базу, только если применила WAL до позиции, которую основная база сообщила
+перед проверкой: реплика с оборванной репликацией иначе выглядела бы актуальной.
+Если здоровых реплик нет, чтения идут на основную базу.
+
+После записи реплика может еще DB_REPLICA_MAX_LAG секунд отдавать старые данные, поэтому
+прочитанное с реплики в это время не кэшируется (см. note_write и server.get_entity_data)."""
+import asyncio
+import itertools
+import logging
+import os
+import time
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+logger = logging.getLogger(__name__)
+
+DB_REPLICA_BALANCE = os.getenv("DB_REPLICA_BALANCE", "round_robin")  # round_robin или least_connections.
+DB_REPLICA_CHECK_INTERVAL = float(os.getenv("DB_REPLICA_CHECK_INTERVAL", 5))  # Период проверки реплик, секунды.
+DB_REPLICA_CHECK_TIMEOUT = float(os.getenv("DB_REPLICA_CHECK_TIMEOUT", 2))  # Таймаут проверки, секунды.
+DB_REPLICA_MAX_LAG = float(os.getenv("DB_REPLICA_MAX_LAG", 10))  # Допустимое отставание реплики, секунды.
+
+# Текущая позиция WAL основной базы, с которой сравнивается реплика.
+PRIMARY_LSN_QUERY = text("SELECT pg_current_wal_lsn()::text")
+# Отставание реплики в секундах. Если WAL применен до позиции основной базы, реплика актуальна,
+# даже если на основной базе давно не было записей; иначе - время с последней примененной транзакции,
+# которое растет и у реплики, переставшей получать WAL. Если позиция основной базы неизвестна
+# (она недоступна), сравнивается полученное и примененное WAL самой реплики. Не реплика - 0.
+REPLICA_LAG_QUERY = text(
+    "SELECT CASE WHEN NOT pg_is_in_recovery() THEN 0 "
+    "WHEN CAST(:primary_lsn AS text) IS NOT NULL "
+    "AND pg_last_wal_replay_lsn() >= CAST(CAST(:primary_lsn AS text) AS pg_lsn) THEN 0 "
+    "WHEN CAST(:primary_lsn AS text) IS NULL AND pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE extract(epoch FROM now() - pg_last_xact_replay_timestamp()) END")
+
+
+class Replica:
+    __slots__ = ('name', 'engine', 'healthy', 'lag')
+
+    def __init__(self, name: str, engine: AsyncEngine):
+        self.name = name
+        self.engine = engine
+        self.healthy = True  # До первой проверки считаем реплику рабочей.
+        self.lag = 0.0
+
+    @property
+    def checked_out(self) -> int:
+        return self.engine.pool.checkedout()
+
+
+class ReplicaSet:
+    """Реплики текущего процесса и выбор реплики для очередного чтения."""
+
+    def __init__(self, balance: str = DB_REPLICA_BALANCE):
+        if balance not in ('round_robin', 'least_connections'):
+            raise ValueError(f"Unknown DB_REPLICA_BALANCE {balance!r}")
+        self.balance = balance
+        self.replicas: list[Replica] = []
+        self.primary: AsyncEngine | None = None  # Основная база: откуда брать позицию WAL для проверки.
+        self._counter = itertools.count()
+        self.replica_reads = 0
+        # Недавно записанные ключи -> до какого момента реплики могут отдавать по ним старые данные.
+        # Реплика, отставшая больше DB_REPLICA_MAX_LAG, исключается не сразу, а при следующей проверке.
+        self.stale_window = DB_REPLICA_MAX_LAG + DB_REPLICA_CHECK_INTERVAL
+        self._recent_writes: dict[tuple, float] = {}
+        self.primary_reads = 0  # Чтения на основной базе: read-your-writes или нет здоровых реплик.
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.replicas)
+
+    def configure(self, engines: dict[str, AsyncEngine], primary: AsyncEngine | None = None):
+        self.replicas = [Replica(name, engine) for name, engine in engines.items()]
+        self.primary = primary
+
+    def pick(self, primary: bool = False) -> AsyncEngine | None:
+        """Движок реплики для чтения; None - читать с основной базы."""
+        if not self.replicas:
+            return None
+        healthy = [replica for replica in self.replicas if replica.healthy]
+        if primary or not healthy:
+            self.primary_reads += 1
+            return None
+        if self.balance == 'least_connections':
+            replica = min(healthy, key=lambda replica: replica.checked_out)
+        else:
+            replica = healthy[next(self._counter) % len(healthy)]
+        self.replica_reads += 1
+        return replica.engine
+
+    def note_write(self, key: tuple):
+        """Отмечает запись по key: пока реплики могут ее не видеть, их ответы по key не кэшируются."""
+        if not self.replicas:
+            return
+        now = time.monotonic()
+        self._recent_writes.pop(key, None)  # Порядок вставки - порядок сроков: окно у всех ключей одно.
+        self._recent_writes[key] = now + self.stale_window
+        expired = itertools.takewhile(lambda item: item[1] <= now, self._recent_writes.items())
+        for expired_key in [key for key, _ in expired]:
+            del self._recent_writes[expired_key]
+
+    def may_be_stale(self, key: tuple) -> bool:
+        """Может ли реплика отдать по key данные старше последней записи."""
+        deadline = self._recent_writes.get(key)
+        return deadline is not None and deadline > time.monotonic()
+
+    async def primary_lsn(self) -> str | None:
+        """Позиция WAL основной базы; None, если она недоступна."""
+        if self.primary is None:
+            return None
+        try:
+            async with asyncio.timeout(DB_REPLICA_CHECK_TIMEOUT):
+                async with self.primary.connect() as conn:
+                    return (await conn.execute(PRIMARY_LSN_QUERY)).scalar()
+        except Exception as e:
+            logger.warning("cannot read WAL position of the primary: %r", e)
+            return None
+
+    async def check(self, replica: Replica, primary_lsn: str | None = None):
+        try:
+            async with asyncio.timeout(DB_REPLICA_CHECK_TIMEOUT):
+                async with replica.engine.connect() as conn:
+                    lag = (await conn.execute(REPLICA_LAG_QUERY, {"primary_lsn": primary_lsn})).scalar()
+        except Exception as e:
+            if replica.healthy:
+                logger.warning("replica %s is unavailable: %r", replica.name, e)
+            replica.healthy = False
+            return
+        # NULL - реплика отстает, но еще не применила ни одной транзакции: насколько - неизвестно.
+        if lag is not None:
+            replica.lag = float(lag)
+        healthy = lag is not None and replica.lag <= DB_REPLICA_MAX_LAG
+        if healthy != replica.healthy:
+            logger.warning("replica %s is %s, lag %.1f s", replica.name, "back" if healthy else "lagging", replica.lag)
+        replica.healthy = healthy
+
+    async def check_all(self):
+        primary_lsn = await self.primary_lsn()
+        await asyncio.gather(*(self.check(replica, primary_lsn) for replica in self.replicas))
+
+    async def run_checks(self, interval: float = DB_REPLICA_CHECK_INTERVAL):
+        while True:
+            await asyncio.sleep(interval)
+            await self.check_all()
+
+    async def dispose(self):
+        for replica in self.replicas:
+            await replica.engine.dispose()
+
+    def stats(self) -> dict:
+        return {
+            "replicas": len(self.replicas),
+            "healthy": sum(replica.healthy for replica in self.replicas),
+            "max_lag_seconds": max((replica.lag for replica in self.replicas), default=0.0),
+            "replica_reads": self.replica_reads,
+            "primary_reads": self.primary_reads,
+            "recent_writes": len(self._recent_writes),
+            "balance": self.balance,
+        }
+
+
+replicas = ReplicaSet()
+
+
+async def replicas_context(app):
+    """Проверяет реплики при старте и затем периодически, закрывает их пулы при остановке."""
+    if not replicas.enabled:
+        yield
+        return
+    await replicas.check_all()
+    task = asyncio.create_task(replicas.run_checks())
+    yield
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+    await replicas.dispose()
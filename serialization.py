@@ -0,0 +1,87 @@
+"""Единый слой сериализации ответов.
+
+Данные для ответов читаются из базы строками (без ORM-объектов и identity map)
+и упаковываются в компактные DTO со __slots__. Кодирование в JSON идет через orjson,
+если он установлен, иначе - через стандартный json без лишних пробелов.
+Список DTO кодируется за один проход, без промежуточного списка словарей."""
+import datetime
+import json
+from dataclasses import dataclass
+
+from aiohttp import web
+
+try:
+    import orjson  # Необязательная зависимость: pip install orjson
+except ImportError:
+    orjson = None
+
+
+@dataclass(slots=True)
+class UserDTO:
+    id: int
+    name: str
+    registration_time: int  # Время регистрации, Unix timestamp.
+
+    @classmethod
+    def from_row(cls, row) -> "UserDTO":
+        """Строка выборки USER_COLUMNS или объект модели User."""
+        return cls(row.id, row.name, to_timestamp(row.registration_time))
+
+    def to_dict(self) -> dict:
+        return {'id': self.id, 'name': self.name, 'registration_time': self.registration_time}
+
+
+@dataclass(slots=True)
+class AdsDTO:
+    ads_id: int
+    title: str
+    description: str
+    owner_id: int
+
+    @classmethod
+    def from_row(cls, row) -> "AdsDTO":
+        """Строка выборки ADS_COLUMNS или объект модели Ads."""
+        return cls(row.ads_id, row.title, row.description, row.owner_id)
+
+    def to_dict(self) -> dict:
+        return {'ads_id': self.ads_id, 'title': self.title, 'description': self.description, 'owner_id': self.owner_id}
+
+
+def to_timestamp(value: datetime.datetime | None) -> int | None:
+    return int(value.timestamp()) if value is not None else None
+
+
+def from_timestamp(value: int) -> datetime.datetime:
+    """Обратное к to_timestamp: unix-время в значение колонки DateTime."""
+    return datetime.datetime.fromtimestamp(value)
+
+
+def _default(obj):
+    """Кодирование DTO стандартным json; orjson кодирует dataclass сам."""
+    if isinstance(obj, (UserDTO, AdsDTO)):
+        return obj.to_dict()
+    if isinstance(obj, datetime.datetime):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+if orjson is not None:
+    def dumps(data) -> bytes:
+        """Кодирует данные (словари, списки, DTO) в JSON-байты."""
+        return orjson.dumps(data, default=_default)
+else:
+    _encoder = json.JSONEncoder(separators=(',', ':'), ensure_ascii=False, default=_default)
+
+    def dumps(data) -> bytes:
+        """Кодирует данные (словари, списки, DTO) в JSON-байты."""
+        return _encoder.encode(data).encode()
+
+
+def json_response(data, status: int = 200, headers=None) -> web.Response:
+    """Замена web.json_response, кодирующая ответ через dumps."""
+    return web.Response(body=dumps(data), status=status, headers=headers, content_type='application/json')
+
+
+def json_body_response(body: bytes, status: int = 200, headers=None) -> web.Response:
+    """Ответ с уже закодированным телом (из кэша или общего для нескольких запросов)."""
+    return web.Response(body=body, status=status, headers=headers, content_type='application/json')
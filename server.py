@@ -1,41 +1,92 @@
 from aiohttp import web  # Aсинхронная клиент-серверная HTTP-библиотека для asyncio и Python
-import json
-from models import Base, engine, Session, User, Ads
+import models
+from models import Session, User, Ads, AdsViews, ADS_SEARCH_DOCUMENT, UTC_NOW, init_engine, read_session, pool_capacity
+from replicas import replicas, replicas_context
 from sqlalchemy.exc import InvalidRequestError
-import bcrypt  # Для безопасного хеширования паролей.
+from hashing import hasher, hasher_context
+from auth import tokens, auth_middleware, require_claims, unauthorized
+from admission import admission, admission_middleware, unlimited, ADMISSION_LIMIT
+from cache import entity_cache
+from conditional import make_etag, is_not_modified, not_modified, validator_headers, to_http_datetime
+from serialization import AdsDTO, UserDTO, dumps, json_response, json_body_response, from_timestamp
+from singleflight import reads
+from counters import view_counter
+from metrics import metrics_middleware, metrics_handler, metrics_server, registry, get_sampled_logger, METRICS_PORT
+import migrations
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy import select
+from sqlalchemy import select, update, delete, values, column, func, text, literal_column, bindparam, tuple_, Integer, String
+from sqlalchemy.dialects.postgresql import insert
 from typing import List
+import os
+import asyncio
+import base64
+import logging
+import re
+import datetime
+import time
 
-app = web.Application()   # Создаем экземпляр класса web
+logger = logging.getLogger(__name__)
+hot_log = get_sampled_logger(__name__)  # Для горячего пути: в лог попадает только доля записей (LOG_SAMPLE_RATE).
 
+ADS_STREAM_FETCH_SIZE = int(os.getenv("ADS_STREAM_FETCH_SIZE", 500))  # Сколько строк читать с курсора за раз.
+SEARCH_DEFAULT_LIMIT = int(os.getenv("SEARCH_DEFAULT_LIMIT", 20))  # Результатов на странице поиска по умолчанию.
+SEARCH_MAX_LIMIT = int(os.getenv("SEARCH_MAX_LIMIT", 100))  # Максимальный размер страницы поиска.
+SEARCH_MAX_CANDIDATES = int(os.getenv("SEARCH_MAX_CANDIDATES", 1000))  # Сколько совпадений ранжировать, не больше.
+SEARCH_MAX_TERMS = 8  # Слов в поисковом запросе, не больше.
+FEED_DEFAULT_LIMIT = int(os.getenv("FEED_DEFAULT_LIMIT", 20))  # Объявлений на странице ленты по умолчанию.
+FEED_MAX_LIMIT = int(os.getenv("FEED_MAX_LIMIT", 100))  # Максимальный размер страницы ленты.
+INT32_MAX = 2 ** 31 - 1
+BULK_CHUNK_SIZE = int(os.getenv("BULK_CHUNK_SIZE", 1000))  # Строк в одном многострочном INSERT/UPDATE.
+BULK_MAX_ITEMS = int(os.getenv("BULK_MAX_ITEMS", 50000))  # Максимум элементов в одном пакетном запросе.
+DB_READ_YOUR_WRITES = float(os.getenv("DB_READ_YOUR_WRITES", 5))  # Сколько секунд после записи клиент читает с основной базы.
+READ_YOUR_WRITES_COOKIE = "primary_until"
 
-def hash_password(password: str) -> str:
-    """Функция для хеширования паролей."""
-    password = password.encode()  # Преобразуется в байтовую последовательность. Это необходимо для работы с bcrypt
-    password = bcrypt.hashpw(password, bcrypt.gensalt())  # Возвращает хеш-пароля в виде байтовой последовательности.
-    password = password.decode()  # Декодирование хеша в строковый формат для удобства использования результата.
-    return password
 
+async def orm_context(app):  # Определение асинхронной функции, которая принимает объект приложения как аргумент.
+    logger.info("start")  # Сообщение о начале работы контекста.
 
-def check_password(pasword: str, hashed_password: str) -> bool:
-    """Для авторизации. Возвращает булевое значение True или False"""
-    password = pasword.encode()
-    hashed_password = hashed_password.encode()
-    return bcrypt.checkpw(password, hashed_password)
+    # Таблицы создаются миграциями (python -m migrations upgrade), при старте только сверяем версию схемы.
+    await migrations.verify(models.engine)
+    views_flusher = asyncio.create_task(view_counter.run())  # Пакетная запись счетчиков просмотров.
 
+    yield  # Передача управления обратно вызывающему коду, позволяя ему использовать контекст.
 
-async def orm_context(app):  # Определение асинхронной функции, которая принимает объект приложения как аргумент.
-    print("start")  # Выводит сообщение о начале работы контекста.
+    views_flusher.cancel()
+    try:
+        await views_flusher
+    except asyncio.CancelledError:
+        pass
+    await view_counter.flush()  # Запросы уже обработаны: записываем оставшиеся просмотры.
+    await models.engine.dispose()  # Асинхронное освобождение ресурсов движка после завершения работы с базой данных.
+    logger.info("shutdown")  # Сообщение о завершении работы контекста.
 
-    async with engine.begin() as conn:  # Асинхронный блок `with`, который управляет транзакцией базы данных.
-        await conn.run_sync(
-            Base.metadata.create_all)  # Выполняет синхронную операцию создания всех таблиц, определенных в метаданных.
 
-    yield  # Передача управления обратно вызывающему коду, позволяя ему использовать контекст.
+class LazySession:
+    """Обертка над AsyncSession, которая создает сессию только при первом обращении.
+
+    Запросы, которые не дошли до базы (ошибка маршрута, валидации, ответ из кэша),
+    не занимают соединение из пула. Все атрибуты проксируются в настоящую сессию."""
 
-    await engine.dispose()  # Асинхронное освобождение ресурсов движка после завершения работы с базой данных.
-    print("SHUTDOWN")  # Выводит сообщение о завершении работы контекста.
+    def __init__(self, factory=Session):
+        self._factory = factory
+        self._session = None
+
+    def __getattr__(self, name):
+        if self._session is None:
+            self._session = self._factory()
+        return getattr(self._session, name)
+
+    async def release(self):
+        """Закрывает сессию и возвращает соединение в пул."""
+        if self._session is not None:
+            session, self._session = self._session, None
+            await session.close()
+
+
+def no_db_session(handler):
+    """Маршрут не использует базу: session_middleware не будет создавать для него сессию."""
+    handler.db_session = False
+    return handler
 
 
 # Позволяет определить session_middleware как промежуточное ПО для обработки запросов в приложении.
@@ -46,23 +97,44 @@ async def orm_context(app):  # Определение асинхронной ф
 async def session_middleware(request: web.Request, handler):
     """Функция session_middleware является асинхронным промежуточным слоем.
     Предназначена для управления сессиями пользователей в рамках обработки HTTP-запросов."""
-    async with Session() as session:  # Контекстный менеджер для автоматического закрытия сессии после завершения блока.
-        request.session = session  # Назначение созданной сессии объекту запроса.
+    # Маршрут не найден или явно отказался от базы - сессия не нужна.
+    if request.match_info.http_exception is not None or not getattr(handler, 'db_session', True):
+        return await handler(request)
+    session = LazySession()  # Сессия откроется только при первом обращении к базе.
+    request.session = session  # Назначение сессии объекту запроса.
+    try:
         response = await handler(request)  # Вызов обработчика запроса с передачей ему объекта запроса.
         return response
+    finally:
+        await session.release()  # Закрываем сессию, если обработчик ее открыл и не освободил сам.
 
-# Гарантирует, что контекст базы данных будет корректно очищен после завершения работы приложения.
-app.cleanup_ctx.append(orm_context)
-# Добавление определенного ранее промежуточного слоя (session_middleware) в список промежуточных слоев приложения.
-# Это указывает, что этот слой должен быть применен ко всем запросам, проходящим через приложение.
-app.middlewares.append(session_middleware)
+
+def reads_from_primary(request: web.Request) -> bool:
+    """Клиент недавно что-то записал: читаем с основной базы, чтобы он увидел свои изменения,
+    даже если реплики еще не догнали ее."""
+    if not replicas.enabled:
+        return False
+    try:
+        return float(request.cookies.get(READ_YOUR_WRITES_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+@web.middleware
+async def read_your_writes_middleware(request: web.Request, handler):
+    """После успешной записи отмечает клиента cookie на DB_READ_YOUR_WRITES секунд (см. reads_from_primary)."""
+    response = await handler(request)
+    if replicas.enabled and request.method not in ('GET', 'HEAD', 'OPTIONS') and response.status < 400:
+        response.set_cookie(READ_YOUR_WRITES_COOKIE, str(time.time() + DB_READ_YOUR_WRITES),
+                            max_age=int(DB_READ_YOUR_WRITES) + 1, httponly=True)
+    return response
 
 
-async def get_http_error(error_class, msg):
+def get_http_error(error_class, msg):
     """Обработчик ошибок."""
     return error_class(
-        text=json.dumps({"error": msg}),
-        content_type='aplication/json'
+        text=dumps({"error": msg}).decode(),
+        content_type='application/json'
     )
 
 
@@ -70,16 +142,133 @@ async def get_user(session: Session, user_id: int) -> User:
     """Получение id пользователя из сессии."""
     user = await session.get(User, user_id)
     if user is None:
-        raise get_http_error(web.HTTPFound, 'User not found')
+        raise get_http_error(web.HTTPNotFound, 'User not found')
     return user
 
 
-async def get_ads(session: Session, ads_id: int) -> Ads:
-    """Получаем объявление."""
-    ads = await session.get(Ads, ads_id)
-    if ads is None:
-        raise get_http_error(web.HTTPFound, 'Ads not found')
-    return ads
+# Поля, которые можно изменить через PATCH: имя поля -> максимальная длина строки (см. validate_bulk_item).
+USER_UPDATE_FIELDS = {'name': 64, 'password': None}
+ADS_UPDATE_FIELDS = {'title': 64, 'description': 384}
+
+
+def check_same_user(request: web.Request, user_id: int):
+    """Пользователь может менять и удалять только себя."""
+    if require_claims(request)['sub'] != user_id:
+        raise get_http_error(web.HTTPForbidden, 'Not allowed to change another user')
+
+
+async def get_update_fields(request: web.Request, fields: dict) -> dict:
+    """Изменяемые поля из тела PATCH: только разрешенные, с проверкой типа и длины."""
+    json_data = await request.json()
+    error = validate_bulk_item(json_data, fields, ())
+    if error is None and not json_data:
+        error = 'No fields to update'
+    if error:
+        raise get_http_error(web.HTTPBadRequest, error)
+    return json_data
+
+
+async def execute_write(session: Session, stmt, unique_error: str | None = None,
+                        foreign_key_error: str | None = None):
+    """Выполняет UPDATE/DELETE ... RETURNING и фиксирует транзакцию.
+
+    Возвращает строку RETURNING или None, если строки с таким ключом нет. Нарушение уникальности
+    (400) и внешнего ключа (409) определяются по ошибке того же запроса, без предварительного чтения."""
+    try:
+        row = (await session.execute(stmt.execution_options(synchronize_session=False))).first()
+        await session.commit()
+    except IntegrityError as e:
+        await session.rollback()
+        if unique_error and 'UniqueViolationError' in str(e.orig):
+            raise get_http_error(web.HTTPBadRequest, unique_error)
+        if foreign_key_error and 'ForeignKeyViolationError' in str(e.orig):
+            raise get_http_error(web.HTTPConflict, foreign_key_error)
+        raise
+    return row
+
+
+# Колонки для ответов: чтение строками без ORM-объектов, порядок совпадает с полями DTO.
+USER_COLUMNS = (User.id, User.name, User.registration_time)
+ADS_COLUMNS = (Ads.ads_id, Ads.title, Ads.description, Ads.owner_id)
+
+
+def cache_entry(data: dict, row) -> dict:
+    """Запись кэша: уже закодированное тело ответа и валидаторы для условных запросов."""
+    return {'body': dumps(data), 'version': row.version, 'updated_at': to_http_datetime(row.updated_at).timestamp()}
+
+
+def entity_response(request: web.Request, kind: str, entity_id: int, entry: dict) -> web.Response:
+    """Ответ с ETag/Last-Modified или 304, если у клиента актуальная версия."""
+    etag = make_etag(kind, entity_id, entry['version'])
+    if is_not_modified(request, etag, entry['updated_at']):
+        return not_modified(etag, entry['updated_at'])
+    return json_body_response(entry['body'], headers=validator_headers(etag, entry['updated_at']))
+
+
+async def load_entity(stmt, dto_class, primary: bool) -> dict | None:
+    """Читает сущность в собственной сессии: запрос общий для всех ожидающих (см. singleflight)
+    и не должен зависеть от сессии запроса, который его начал. Читает с реплики, если primary=False."""
+    async with read_session(primary) as session:
+        row = (await session.execute(stmt)).first()
+    return None if row is None else cache_entry(dto_class.from_row(row).to_dict(), row)
+
+
+async def get_entity_data(kind: str, entity_id: int, stmt, dto_class, primary: bool = False) -> dict | None:
+    """Запись кэша сущности; при промахе одновременные запросы одной сущности читают базу один раз.
+
+    primary=True (read-your-writes) - читать мимо кэша с основной базы: в кэше может быть
+    значение, прочитанное с отстающей реплики. Свежее значение заменяет его в кэше."""
+    if not primary:
+        hit, entry = await entity_cache.get(kind, entity_id)
+        if hit:
+            return entry
+
+    async def remember(entry):
+        if not primary and replicas.may_be_stale((kind, entity_id)):
+            return  # Недавняя запись могла еще не дойти до реплики: не закрепляем старое значение в кэше.
+        if entry is None:
+            await entity_cache.set_missing(kind, entity_id)  # Кэшируем и отсутствие.
+        else:
+            await entity_cache.set(kind, entity_id, entry)
+
+    key = (kind, entity_id, read_target(primary))
+    return await reads.do(key, lambda: load_entity(stmt, dto_class, primary), on_result=remember)
+
+
+def read_target(primary: bool) -> str:
+    """Часть ключа объединения чтений: чтения с основной базы не ждут ответа реплики."""
+    return 'primary' if primary else 'replica'
+
+
+async def invalidate_entity(kind: str, entity_id: int):
+    """После записи: сбрасывает кэш и идущие чтения, чтобы их результат не попал в кэш."""
+    await entity_cache.invalidate(kind, entity_id)
+    replicas.note_write((kind, entity_id))
+    for primary in (False, True):
+        reads.forget((kind, entity_id, read_target(primary)))
+
+
+def forget_user_ads(owner_id: int | None = None):
+    """Сбрасывает идущие чтения списков объявлений владельца (всех владельцев, если owner_id не задан)."""
+    reads.forget_where(lambda key: key[0] == 'ads-user' and (owner_id is None or key[1] == owner_id))
+
+
+async def get_user_data(user_id: int, primary: bool = False) -> dict:
+    """Данные пользователя для ответа (см. cache_entry): сначала из кэша, при промахе - из базы."""
+    stmt = select(*USER_COLUMNS, User.version, User.updated_at).where(User.id == user_id)
+    data = await get_entity_data('user', user_id, stmt, UserDTO, primary)
+    if data is None:
+        raise get_http_error(web.HTTPNotFound, 'User not found')
+    return data
+
+
+async def get_ads_data(ads_id: int, primary: bool = False) -> dict:
+    """Данные объявления для ответа (см. cache_entry): сначала из кэша, при промахе - из базы."""
+    stmt = select(*ADS_COLUMNS, Ads.version, Ads.updated_at).where(Ads.ads_id == ads_id)
+    data = await get_entity_data('ads', ads_id, stmt, AdsDTO, primary)
+    if data is None:
+        raise get_http_error(web.HTTPNotFound, 'Ads not found')
+    return data
 
 
 async def add_user(session: Session, user: User):
@@ -116,14 +305,70 @@ async def add_ads(session: Session, ads: Ads):
     return ads
 
 
-async def get_all_ads_for_user(session: Session, user_id: int):
+async def get_all_ads_for_user(session: Session, user_id: int) -> list[AdsDTO]:
     """Для получения всех объявлений."""
-    stmt = select(Ads).where(Ads.owner_id == user_id)
+    stmt = select(*ADS_COLUMNS).where(Ads.owner_id == user_id)
     result = await session.execute(stmt)
-    ads_list = result.scalars().all()
+    ads_list = [AdsDTO.from_row(row) for row in result]
     return ads_list
 
 
+async def get_user_ads_validators(user_id: int, output_format: str,
+                                  primary: bool = False) -> tuple[str, datetime.datetime | None]:
+    """ETag и Last-Modified списка объявлений пользователя по агрегату, без чтения самих строк.
+
+    Добавление и изменение объявления сдвигают max(updated_at) (из индекса (owner_id, updated_at)),
+    удаление - app_users.ads_deleted_at; время изменения списка - большее из них. Формат выдачи
+    входит в ETag: у JSON-массива и NDJSON одного списка разные тела."""
+    deleted_at = select(User.ads_deleted_at).where(User.id == user_id).scalar_subquery()
+    stmt = select(func.count(), func.max(Ads.updated_at), deleted_at).where(Ads.owner_id == user_id)
+    async with read_session(primary) as session:
+        count, updated_at, deleted_at = (await session.execute(stmt)).one()
+    last_modified = max((value for value in (updated_at, deleted_at) if value is not None), default=None)
+    stamp = int(to_http_datetime(last_modified).timestamp() * 1000000) if last_modified else 0
+    return make_etag('ads-user', user_id, count, stamp, output_format), last_modified
+
+
+async def get_user_ads_body(user_id: int, primary: bool = False) -> bytes:
+    """Закодированный список объявлений пользователя, в собственной сессии (см. load_entity)."""
+    async with read_session(primary) as session:
+        return dumps(await get_all_ads_for_user(session, user_id))
+
+
+async def stream_ads(request: web.Request, session: Session, stmt, ndjson: bool,
+                     headers: dict | None = None) -> web.StreamResponse:
+    """Потоковая выгрузка объявлений.
+
+    stmt выбирает колонки (например, ADS_COLUMNS), каждая строка отдается как объект JSON.
+    Строки читаются серверным курсором порциями по ADS_STREAM_FETCH_SIZE и сразу пишутся в ответ,
+    поэтому память не растет с числом объявлений. ndjson=True - по объекту на строку,
+    иначе - JSON-массив, который дописывается по мере чтения."""
+    response = web.StreamResponse(headers=headers)
+    response.content_type = 'application/x-ndjson' if ndjson else 'application/json'
+    response.enable_chunked_encoding()
+    await response.prepare(request)
+
+    stmt = stmt.execution_options(yield_per=ADS_STREAM_FETCH_SIZE)
+    result = await session.stream(stmt)
+    first = True
+    if not ndjson:
+        await response.write(b'[')
+    async for partition in result.mappings().partitions():  # Одна порция - одна запись в сокет.
+        chunk = []
+        for row in partition:
+            data = dumps(dict(row))
+            if ndjson:
+                chunk.append(data + b'\n')
+            else:
+                chunk.append(data if first else b',' + data)
+                first = False
+        await response.write(b''.join(chunk))
+    if not ndjson:
+        await response.write(b']')
+    await response.write_eof()
+    return response
+
+
 class UserView(web.View):
 
     @property  # Декоратор @property позволяет обращаться к методу как к атрибуту
@@ -136,75 +381,75 @@ class UserView(web.View):
 
     async def get(self):  # Асинхронный обработчик GET-запросов
         """Для просмотра пользователя."""
-        user = await get_user(self.session, self.user_id)  # Получает информацию о пользователе асинхронно.
-        return web.json_response({  # Возвращает JSON-ответ с информацией о пользователе
-            'id': user.id,  # Идентификатор пользователя
-            'name': user.name,  # Имя пользователя
-            'registration_time': int(user.registration_time.timestamp())  # Время регистрации пользователя.
-        })
+        user = await get_user_data(self.user_id, reads_from_primary(self.request))  # Получает информацию о пользователе (из кэша или базы).
+        return entity_response(self.request, 'user', self.user_id, user)  # JSON-ответ или 304
 
     async def post(self):  # Определение асинхронного метода post
         """Для создания пользователя."""
         json_data = await self.request.json()  # Асинхронное получение JSON из запроса
-        print(json_data)
-        json_data["password"] = hash_password(
-            json_data["password"])  # Хеширование пароля перед сохранением пользователя
+        hot_log.debug("create user %s", json_data.get("name"))  # Пароль в лог не пишем.
+        json_data["password"] = await hasher.hash(
+            json_data["password"])  # Хеширование пароля в пуле, не блокируя цикл событий
         user = User(**json_data)  # Создание объекта User с данными из JSON
         user = await add_user(self.session, user)  # Асинхронная добавление пользователя в базу данных
+        await invalidate_entity('user', user.id)  # Сбрасываем возможную запись "не найдено".
         response_message = {
             "id": user.id,
             "name": user.name,
             "status": "created"
         }
-        return web.json_response(response_message)
+        return json_response(response_message)
 
     async def patch(self):
-        """Для исправления данных пользователя."""
-        try:
-            user = await get_user(self.session, self.user_id)  # Получаем пользователя.
-            old_name = user.name  # Сохраняем старое имя пользователя
-            json_data = await self.request.json()  # Извлекаем JSON данные из запроса.
-            if "password" in json_data:  # Если в исправляемых данных присутствует пароль, то...
-                json_data["password"] = hash_password(json_data["password"])  # ...хешируем пароль перед сохранением.
-            for field, value in json_data.items():  # Применяем изменения к объекту пользователя
-                setattr(user, field, value)
-            await add_user(self.session, user)  # Сохраняем обновленного пользователя в базе данных
-            response_message = {
-                "id": user.id,
-                "It was": old_name,  # Отображаем старое имя
-                "It became": user.name,  # Отображаем новое имя
-                "status": "has been changed"  # Статус изменено.
-            }
-            return web.json_response(response_message)
-        except IntegrityError as e:
-            if 'UniqueViolationError' in str(e.orig):  # Проверяем, связана ли ошибка с нарушением уникальности.
-                return web.json_response({"error": "A user with this name already exists."}, status=400)
-            else:
-                raise  # Перебрасываем другую ошибку, если она возникла
+        """Для исправления данных пользователя.
+
+        Один запрос UPDATE ... RETURNING: старое имя берется из CTE с блокировкой строки,
+        отсутствие пользователя и занятое имя видны по результату того же запроса."""
+        check_same_user(self.request, self.user_id)
+        fields = await get_update_fields(self.request, USER_UPDATE_FIELDS)
+        if "password" in fields:  # Если в исправляемых данных присутствует пароль, то...
+            fields["password"] = await hasher.hash(fields["password"])  # ...хешируем пароль в пуле.
+        old = select(User.id, User.name).where(User.id == self.user_id).with_for_update().cte('old')
+        stmt = (update(User).where(User.id == old.c.id)
+                .values(**fields, version=User.version + 1, updated_at=UTC_NOW)  # Новая версия для ETag.
+                .returning(User.id, old.c.name.label('old_name'), User.name))
+        user = await execute_write(self.session, stmt, unique_error="A user with this name already exists.")
+        if user is None:
+            raise get_http_error(web.HTTPNotFound, 'User not found')
+        await invalidate_entity('user', user.id)
+        response_message = {
+            "id": user.id,
+            "It was": user.old_name,  # Отображаем старое имя
+            "It became": user.name,  # Отображаем новое имя
+            "status": "has been changed"  # Статус изменено.
+        }
+        return json_response(response_message)
 
     async def delete(self):
         """Для удаления пользователя."""
-        user = await get_user(self.session, self.user_id)  # Получаем пользователя.
-        await self.session.delete(user)
-        await self.session.commit()
+        check_same_user(self.request, self.user_id)
+        stmt = delete(User).where(User.id == self.user_id).returning(User.id, User.name)
+        user = await execute_write(self.session, stmt, foreign_key_error="User has ads, delete them first.")
+        if user is None:
+            raise get_http_error(web.HTTPNotFound, 'User not found')
+        await invalidate_entity('user', user.id)
         response_message = {
             "id": user.id,
             "name": user.name,
             "status": "delete"
         }
-        return web.json_response(response_message)
+        return json_response(response_message)
 
 
 class AdsView(web.View):
 
     @property  # Декоратор @property позволяет обращаться к методу как к атрибуту
     def session(self) -> Session:
-        print(self.request.session)
         return self.request.session  # Возвращает текущую сессию запроса
 
     @property
     def user_id(self) -> int:  # Аналогично предыдущему, возвращает идентификатор пользователя из URL.
-        print(f'match_info = {self.request.match_info}')
+        hot_log.debug("match_info = %s", self.request.match_info)
         try:
             return int(self.request.match_info["user_id"])  # Извлекает "user_id" из информации о маршруте запроса.
         except KeyError:
@@ -217,28 +462,26 @@ class AdsView(web.View):
     async def get(self):
         """Для просмотра объявления."""
 
-        ads = await get_ads(self.session, self.ads_id)  # Получает информацию об объявлении асинхронно.
-        print(dir(ads))
-        return web.json_response({  # Возвращает JSON-ответ с информацией об объявлении.
-            'ads_id': ads.ads_id,  # Идентификатор объявления.
-            'title': ads.title,  # Заголовок объявления.
-            'description': ads.description,  # Описание объявления.
-            "owner_id": ads.owner_id  # Автор
-        })
+        ads = await get_ads_data(self.ads_id, reads_from_primary(self.request))  # Получает информацию об объявлении (из кэша или базы).
+        view_counter.hit(self.ads_id)  # Только в памяти, в базу попадет пакетом.
+        hot_log.debug("ads %s", ads)
+        return entity_response(self.request, 'ads', self.ads_id, ads)  # JSON-ответ или 304
 
     async def post(self):
         """Дописать если объявление уже сущесвует, если пользователь не найден."""
         json_data = await self.request.json()
 
-        print(f'post json_data = {json_data}')
+        hot_log.debug("post json_data = %s", json_data)
 
         owner = await get_user(self.session, self.user_id)
 
         if not owner:
-            return web.json_response({"error": "Owner not found"}, status=404)
+            return json_response({"error": "Owner not found"}, status=404)
 
         ads = Ads(**json_data, owner=owner)
         ads = await add_ads(self.session, ads)
+        await invalidate_entity('ads', ads.ads_id)  # Сбрасываем возможную запись "не найдено".
+        forget_user_ads(ads.owner_id)
         response_message = {
             "id": ads.ads_id,
             "title": ads.title,
@@ -246,47 +489,57 @@ class AdsView(web.View):
             "status": "created",
             "owner_id": ads.owner_id
         }
-        return web.json_response(response_message)
+        return json_response(response_message)
 
     async def patch(self):
-        """Для исправления объявления."""
-        try:
-            ads = await get_ads(self.session, self.ads_id)  # Получаем пользователя.
-            old_title = ads.title  # Сохраняем старое имя пользователя
-            old_description = ads.description  # Сохраняем старое содержимое
-
-            json_data = await self.request.json()  # Извлекаем JSON данные из запроса.
-            # if "password" in json_data:  # Если в исправляемых данных присутствует пароль, то...
-            #     json_data["password"] = hash_password(json_data["password"])  # ...хешируем пароль перед сохранением.
-            for field, value in json_data.items():  # Применяем изменения к объекту пользователя
-                setattr(ads, field, value)
-            await add_ads(self.session, ads)  # Сохраняем обновленного пользователя в базе данных
-            response_message = {
-                "id": ads.ads_id,
-                "old_title": old_title,
-                "old_description": old_description,
-                "new_title": ads.title,  # Заголовок объявления.
-                "description": ads.description,  # Описание объявления.
-                "status": "has been changed"  # Статус изменено.
-            }
-            return web.json_response(response_message)
-        except IntegrityError as e:
-            if 'UniqueViolationError' in str(e.orig):  # Проверяем, связана ли ошибка с нарушением уникальности.
-                return web.json_response({"error": "A ads with this name already exists."}, status=400)
-            else:
-                raise  # Перебрасываем другую ошибку, если она возникла
+        """Для исправления объявления одним запросом UPDATE ... RETURNING (см. UserView.patch).
+
+        Изменить можно только свое объявление: владелец берется из токена, чужое объявление
+        неотличимо от отсутствующего (404)."""
+        owner_id = require_claims(self.request)['sub']
+        fields = await get_update_fields(self.request, ADS_UPDATE_FIELDS)
+        old = (select(Ads.ads_id, Ads.title, Ads.description)
+               .where(Ads.ads_id == self.ads_id, Ads.owner_id == owner_id).with_for_update().cte('old'))
+        stmt = (update(Ads).where(Ads.ads_id == old.c.ads_id)
+                .values(**fields, version=Ads.version + 1, updated_at=UTC_NOW)  # Новая версия для ETag.
+                .returning(Ads.ads_id, Ads.owner_id, old.c.title.label('old_title'),
+                           old.c.description.label('old_description'), Ads.title, Ads.description))
+        ads = await execute_write(self.session, stmt, unique_error="A ads with this name already exists.")
+        if ads is None:
+            raise get_http_error(web.HTTPNotFound, 'Ads not found')
+        await invalidate_entity('ads', ads.ads_id)
+        forget_user_ads(ads.owner_id)
+        response_message = {
+            "id": ads.ads_id,
+            "old_title": ads.old_title,
+            "old_description": ads.old_description,
+            "new_title": ads.title,  # Заголовок объявления.
+            "description": ads.description,  # Описание объявления.
+            "status": "has been changed"  # Статус изменено.
+        }
+        return json_response(response_message)
 
     async def delete(self):
-        """Для удаления объявления."""
-        ads = await get_ads(self.session, self.ads_id)  # Получаем пользователя.
-        await self.session.delete(ads)
-        await self.session.commit()
+        """Для удаления своего объявления одним запросом DELETE ... RETURNING (см. patch).
+
+        В том же запросе отмечается время удаления у владельца: от него зависит Last-Modified его списка."""
+        owner_id = require_claims(self.request)['sub']
+        deleted = (delete(Ads).where(Ads.ads_id == self.ads_id, Ads.owner_id == owner_id)
+                   .returning(Ads.ads_id, Ads.title, Ads.owner_id).cte('deleted'))
+        stmt = (update(User).where(User.id == deleted.c.owner_id).values(ads_deleted_at=UTC_NOW)
+                .returning(deleted.c.ads_id, deleted.c.title, deleted.c.owner_id))
+        ads = await execute_write(self.session, stmt)
+        if ads is None:
+            raise get_http_error(web.HTTPNotFound, 'Ads not found')
+        await invalidate_entity('ads', ads.ads_id)
+        forget_user_ads(ads.owner_id)
+        view_counter.forget(ads.ads_id)
         response_message = {
             "id": ads.ads_id,
             "name": ads.title,
             "status": "delete"
         }
-        return web.json_response(response_message)
+        return json_response(response_message)
 
 
 class AdsUserView(web.View):
@@ -310,36 +563,506 @@ class AdsUserView(web.View):
         """Для просмотра всех объявлений пользователя."""
         user_id = self.user_id
         if user_id is None:
-            return web.json_response({"error": "User ID not found"}, status=404)
+            return json_response({"error": "User ID not found"}, status=404)
+
+        # ?format=ndjson или ?format=stream (JSON-массив) включают потоковую выгрузку.
+        output_format = self.request.query.get("format")
+        if output_format is None and 'application/x-ndjson' in self.request.headers.get('Accept', ''):
+            output_format = 'ndjson'
+        if output_format not in ('ndjson', 'stream'):
+            output_format = 'json'
 
-        ads_list = await get_all_ads_for_user(self.session, user_id)
+        primary = reads_from_primary(self.request)
+        target = read_target(primary)
+        # Сначала дешевая проверка актуальности: если у клиента та же версия списка, строки не читаем.
+        # Одновременные запросы одного списка читают базу один раз.
+        etag, last_modified = await reads.do(('ads-user', user_id, target, output_format),
+                                             lambda: get_user_ads_validators(user_id, output_format, primary))
+        if is_not_modified(self.request, etag, last_modified):
+            response = not_modified(etag, last_modified)
+            response.headers['Vary'] = 'Accept'  # Формат выбирается и по заголовку Accept.
+            return response
+        headers = validator_headers(etag, last_modified)
+        headers['Vary'] = 'Accept'
 
-        response_data = [
-            {
-                'ads_id': ad.ads_id,
-                'title': ad.title,
-                'description': ad.description,
-                "owner_id": ad.owner_id
-            } for ad in ads_list
-        ]
+        if output_format in ('ndjson', 'stream'):
+            stmt = select(*ADS_COLUMNS).where(Ads.owner_id == user_id)
+            async with read_session(primary) as session:
+                return await stream_ads(self.request, session, stmt, ndjson=output_format == 'ndjson',
+                                        headers=headers)
 
-        return web.json_response(response_data)
+        # Тело кодируется один раз и отдается всем, кто ждал тот же список той же версии.
+        body = await reads.do(('ads-user', user_id, etag, target), lambda: get_user_ads_body(user_id, primary))
+        return json_body_response(body, headers=headers)
 
 
-# Формируем routes с помощью метода Application - add_routes.
-app.add_routes([
+def build_search_query(query: str, prefix: bool) -> str | None:
+    """Строит запрос для to_tsquery: слова через &, с prefix=True каждое слово ищется как префикс."""
+    terms = re.findall(r'\w+', query.lower())[:SEARCH_MAX_TERMS]
+    if not terms:
+        return None
+    suffix = ':*' if prefix else ''
+    return ' & '.join(f"'{term}'{suffix}" for term in terms)
+
+
+def get_int_param(request: web.Request, name: str, default: int, minimum: int, maximum: int) -> int:
+    """Целочисленный параметр строки запроса в допустимых пределах."""
+    try:
+        value = int(request.query.get(name, default))
+    except ValueError:
+        raise get_http_error(web.HTTPBadRequest, f'{name} must be an integer')
+    return min(max(value, minimum), maximum)
+
+
+def get_optional_int_param(request: web.Request, name: str, maximum: int = INT32_MAX) -> int | None:
+    """Необязательный целочисленный параметр строки запроса: None, если не передан."""
+    if name not in request.query:
+        return None
+    return get_int_param(request, name, 0, 0, maximum)
+
+
+def encode_cursor(registration_time: datetime.datetime, ads_id: int) -> str:
+    """Непрозрачный курсор ленты: позиция последнего объявления страницы."""
+    raw = f"{registration_time.isoformat()}|{ads_id}".encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode()
+
+
+def decode_cursor(cursor: str) -> tuple[datetime.datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        registration_time, ads_id = raw.split('|')
+        return datetime.datetime.fromisoformat(registration_time), int(ads_id)
+    except ValueError:  # Ошибки base64, UTF-8 и разбора - подклассы ValueError.
+        raise get_http_error(web.HTTPBadRequest, 'Invalid cursor')
+
+
+class AdsFeedView(web.View):
+
+    async def get(self):
+        """Лента объявлений, новые сначала.
+
+        ?limit= - размер страницы, ?cursor= - next_cursor предыдущей страницы, ?owner_id= - объявления
+        одного владельца, ?since= и ?until= - время размещения, unix-время (until не включается).
+        Страница выбирается условием (registration_time, ads_id) < курсор по индексу
+        ix_app_ads_registration_time_ads_id или ix_app_ads_owner_id_registration_time_ads_id,
+        поэтому любая страница стоит столько же, сколько первая, в отличие от OFFSET."""
+        limit = get_int_param(self.request, 'limit', FEED_DEFAULT_LIMIT, 1, FEED_MAX_LIMIT)
+        owner_id = get_optional_int_param(self.request, 'owner_id')
+        since = get_optional_int_param(self.request, 'since')
+        until = get_optional_int_param(self.request, 'until')
+        cursor = self.request.query.get('cursor')
+
+        stmt = select(*ADS_COLUMNS, Ads.registration_time).where(Ads.registration_time.is_not(None))
+        if owner_id is not None:
+            stmt = stmt.where(Ads.owner_id == owner_id)
+        if since is not None:
+            stmt = stmt.where(Ads.registration_time >= from_timestamp(since))
+        if until is not None:
+            stmt = stmt.where(Ads.registration_time < from_timestamp(until))
+        if cursor:
+            stmt = stmt.where(tuple_(Ads.registration_time, Ads.ads_id) < tuple_(*decode_cursor(cursor)))
+        # Лишняя строка показывает, есть ли следующая страница, без отдельного count.
+        stmt = stmt.order_by(Ads.registration_time.desc(), Ads.ads_id.desc()).limit(limit + 1)
+
+        async with read_session(reads_from_primary(self.request)) as session:
+            rows = (await session.execute(stmt)).all()
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1].registration_time, rows[-1].ads_id)
+        return json_response({'items': [AdsDTO.from_row(row) for row in rows], 'next_cursor': next_cursor})
+
+
+class AdsSearchView(web.View):
+
+    @property
+    def session(self) -> Session:
+        return self.request.session
+
+    async def get(self):
+        """Полнотекстовый поиск по заголовкам и описаниям объявлений.
+
+        ?q= - поисковая строка, ?prefix=0 - искать слова целиком, ?limit= и ?offset= - страница,
+        ?format=ndjson - по объекту на строку. Ранжируются только SEARCH_MAX_CANDIDATES самых новых
+        совпадений: для частых слов объявление с лучшим рангом, но старше них, в выдачу не попадет.
+        Зато ранжирование не растет с числом совпадений, а отбор кандидатов детерминирован."""
+        tsquery = build_search_query(self.request.query.get('q', ''), self.request.query.get('prefix', '1') != '0')
+        if tsquery is None:
+            raise get_http_error(web.HTTPBadRequest, 'Query parameter q is required')
+        limit = get_int_param(self.request, 'limit', SEARCH_DEFAULT_LIMIT, 1, SEARCH_MAX_LIMIT)
+        offset = get_int_param(self.request, 'offset', 0, 0, SEARCH_MAX_CANDIDATES)
+
+        ts_query = func.to_tsquery(text("'simple'::regconfig"), bindparam('tsquery', tsquery))
+        document = literal_column(ADS_SEARCH_DOCUMENT)
+        candidates = (
+            select(Ads.ads_id)
+            .where(document.op('@@')(ts_query))
+            .order_by(Ads.registration_time.desc(), Ads.ads_id.desc())
+            .limit(SEARCH_MAX_CANDIDATES)
+            .subquery()
+        )
+        rank = func.ts_rank_cd(document, ts_query)
+        stmt = (
+            select(*ADS_COLUMNS, rank.label('rank'))
+            .join(candidates, candidates.c.ads_id == Ads.ads_id)
+            .order_by(rank.desc(), Ads.ads_id)
+            .limit(limit)
+            .offset(offset)
+        )
+        return await stream_ads(self.request, self.session, stmt, ndjson=self.request.query.get('format') == 'ndjson')
+
+
+# Допустимые поля пакетных запросов: имя поля -> максимальная длина строки (None - целое число).
+USER_BULK_FIELDS = {'name': 64, 'password': None}
+ADS_BULK_FIELDS = {'title': 64, 'description': 384, 'owner_id': None}
+ADS_BULK_UPDATE_FIELDS = {'ads_id': None, 'title': 64, 'description': 384}
+
+
+def chunks(items: list, size: int = BULK_CHUNK_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+async def get_bulk_items(request: web.Request) -> list:
+    """Извлекает из запроса JSON-массив элементов пакета."""
+    json_data = await request.json()
+    if not isinstance(json_data, list):
+        raise get_http_error(web.HTTPBadRequest, 'Expected a JSON array')
+    if len(json_data) > BULK_MAX_ITEMS:
+        raise get_http_error(web.HTTPRequestEntityTooLarge, f'No more than {BULK_MAX_ITEMS} items per request')
+    return json_data
+
+
+def validate_bulk_item(item, fields: dict, required) -> str | None:
+    """Проверяет один элемент пакета. Возвращает текст ошибки или None."""
+    if not isinstance(item, dict):
+        return 'Item must be an object'
+    unknown = set(item) - set(fields)
+    if unknown:
+        return f'Unknown fields: {", ".join(sorted(unknown))}'
+    missing = set(required) - set(item)
+    if missing:
+        return f'Missing fields: {", ".join(sorted(missing))}'
+    for field, value in item.items():
+        max_length = fields[field]
+        if field == 'password':
+            if not isinstance(value, str) or not value:
+                return 'password must be a non-empty string'
+        elif max_length is None:
+            if not isinstance(value, int) or isinstance(value, bool):
+                return f'{field} must be an integer'
+        elif not isinstance(value, str) or len(value) > max_length:
+            return f'{field} must be a string of at most {max_length} characters'
+    return None
+
+
+def bulk_response(results: list) -> web.Response:
+    summary = {}
+    for result in results:
+        summary[result['status']] = summary.get(result['status'], 0) + 1
+    return json_response({'summary': summary, 'results': results})
+
+
+class BulkUserView(web.View):
+
+    @property
+    def session(self) -> Session:
+        return self.request.session
+
+    async def post(self):
+        """Пакетное создание пользователей.
+
+        Пароли хешируются параллельно в пуле, строки пишутся многострочным INSERT ... RETURNING
+        порциями по BULK_CHUNK_SIZE в одной транзакции. Занятые имена не прерывают пакет,
+        а попадают в результат со статусом conflict."""
+        items = await get_bulk_items(self.request)
+        results = [None] * len(items)
+        valid = []
+        for index, item in enumerate(items):
+            error = validate_bulk_item(item, USER_BULK_FIELDS, USER_BULK_FIELDS)
+            if error:
+                results[index] = {'index': index, 'status': 'invalid', 'error': error}
+            else:
+                valid.append((index, item))
+
+        hashed = await hasher.hash_many([item['password'] for _, item in valid])
+        rows = [{'name': item['name'], 'password': password} for (_, item), password in zip(valid, hashed)]
+
+        for chunk_items, chunk_rows in zip(chunks(valid), chunks(rows)):
+            stmt = insert(User).values(chunk_rows).on_conflict_do_nothing(
+                index_elements=[User.name]).returning(User.id, User.name)
+            created = {name: user_id for user_id, name in await self.session.execute(stmt)}
+            for index, item in chunk_items:
+                user_id = created.pop(item['name'], None)  # pop: повтор имени внутри пакета - тоже конфликт.
+                if user_id is None:
+                    results[index] = {'index': index, 'status': 'conflict', 'error': 'A user with this name already exists.'}
+                else:
+                    results[index] = {'index': index, 'status': 'created', 'id': user_id, 'name': item['name']}
+        await self.session.commit()
+
+        for result in results:
+            if result['status'] == 'created':
+                await invalidate_entity('user', result['id'])  # Сбрасываем возможные записи "не найдено".
+        return bulk_response(results)
+
+
+class BulkAdsView(web.View):
+
+    @property
+    def session(self) -> Session:
+        return self.request.session
+
+    async def post(self):
+        """Пакетное создание объявлений.
+
+        Владельцы проверяются одним запросом, объявления пишутся многострочным INSERT ... RETURNING
+        порциями по BULK_CHUNK_SIZE в одной транзакции. Занятые заголовки попадают в результат
+        со статусом conflict, не прерывая пакет."""
+        items = await get_bulk_items(self.request)
+        results = [None] * len(items)
+        valid = []
+        for index, item in enumerate(items):
+            error = validate_bulk_item(item, ADS_BULK_FIELDS, ADS_BULK_FIELDS)
+            if error:
+                results[index] = {'index': index, 'status': 'invalid', 'error': error}
+            else:
+                valid.append((index, item))
+
+        owner_ids = {item['owner_id'] for _, item in valid}
+        existing_owners = set()
+        for chunk in chunks(list(owner_ids)):
+            existing_owners.update((await self.session.scalars(select(User.id).where(User.id.in_(chunk)))).all())
+        with_owner = []
+        for index, item in valid:
+            if item['owner_id'] in existing_owners:
+                with_owner.append((index, item))
+            else:
+                results[index] = {'index': index, 'status': 'not_found', 'error': 'Owner not found'}
+
+        for chunk in chunks(with_owner):
+            stmt = insert(Ads).values([item for _, item in chunk]).on_conflict_do_nothing(
+                index_elements=[Ads.title]).returning(Ads.ads_id, Ads.title)
+            created = {title: ads_id for ads_id, title in await self.session.execute(stmt)}
+            for index, item in chunk:
+                ads_id = created.pop(item['title'], None)  # pop: повтор заголовка внутри пакета - тоже конфликт.
+                if ads_id is None:
+                    results[index] = {'index': index, 'status': 'conflict', 'error': 'A ads with this name already exists.'}
+                else:
+                    results[index] = {'index': index, 'status': 'created', 'id': ads_id, 'owner_id': item['owner_id']}
+        await self.session.commit()
+
+        for result in results:
+            if result['status'] == 'created':
+                await invalidate_entity('ads', result['id'])  # Сбрасываем возможные записи "не найдено".
+                forget_user_ads(result['owner_id'])
+        return bulk_response(results)
+
+    async def patch(self):
+        """Пакетное изменение объявлений.
+
+        Каждая порция - один UPDATE ... FROM (VALUES ...) RETURNING внутри точки сохранения.
+        Если порция упирается в уникальность заголовка, она повторяется поштучно,
+        чтобы отметить конфликтующие элементы и сохранить остальные.
+        Меняются только объявления владельца из токена, чужие отмечаются как not_found."""
+        owner_id = require_claims(self.request)['sub']
+        items = await get_bulk_items(self.request)
+        results = [None] * len(items)
+        valid = []
+        seen = set()
+        for index, item in enumerate(items):
+            error = validate_bulk_item(item, ADS_BULK_UPDATE_FIELDS, ('ads_id',))
+            if error is None and item['ads_id'] in seen:
+                error = 'Duplicate ads_id in batch'
+            if error:
+                results[index] = {'index': index, 'status': 'invalid', 'error': error}
+            else:
+                seen.add(item['ads_id'])
+                valid.append((index, item))
+
+        for chunk in chunks(valid):
+            rows = [(item['ads_id'], item.get('title'), item.get('description')) for _, item in chunk]
+            new_values = values(column('ads_id', Integer), column('title', String), column('description', String),
+                                name='new_values').data(rows)
+            stmt = update(Ads).where(Ads.ads_id == new_values.c.ads_id, Ads.owner_id == owner_id).values(
+                title=func.coalesce(new_values.c.title, Ads.title),
+                description=func.coalesce(new_values.c.description, Ads.description),
+                version=Ads.version + 1,
+                updated_at=UTC_NOW,
+            ).returning(Ads.ads_id).execution_options(synchronize_session=False)
+            try:
+                async with self.session.begin_nested():
+                    updated = set((await self.session.scalars(stmt)).all())
+            except IntegrityError as e:
+                if 'UniqueViolationError' not in str(e.orig):
+                    raise
+                updated = await self._update_one_by_one(chunk, results, owner_id)
+            for index, item in chunk:
+                if results[index] is not None:
+                    continue
+                if item['ads_id'] in updated:
+                    results[index] = {'index': index, 'status': 'updated', 'id': item['ads_id']}
+                else:
+                    results[index] = {'index': index, 'status': 'not_found', 'error': 'Ads not found'}
+        await self.session.commit()
+
+        for result in results:
+            if result['status'] == 'updated':
+                await invalidate_entity('ads', result['id'])
+        forget_user_ads()  # Владельцы измененных объявлений здесь не известны.
+        return bulk_response(results)
+
+    async def _update_one_by_one(self, chunk: list, results: list, owner_id: int) -> set:
+        """Повторяет порцию поштучно, каждый элемент в своей точке сохранения."""
+        updated = set()
+        for index, item in chunk:
+            fields = {field: value for field, value in item.items() if field != 'ads_id'}
+            if not fields:
+                fields = {'title': Ads.title}  # Пустое изменение - только проверка существования.
+            stmt = update(Ads).where(Ads.ads_id == item['ads_id'], Ads.owner_id == owner_id).values(
+                **fields, version=Ads.version + 1, updated_at=UTC_NOW).returning(
+                Ads.ads_id).execution_options(synchronize_session=False)
+            try:
+                async with self.session.begin_nested():
+                    ads_id = await self.session.scalar(stmt)
+            except IntegrityError as e:
+                if 'UniqueViolationError' not in str(e.orig):
+                    raise
+                results[index] = {'index': index, 'status': 'conflict', 'error': 'A ads with this name already exists.'}
+                continue
+            if ads_id is not None:
+                updated.add(ads_id)
+        return updated
+
+
+@no_db_session
+async def login(request: web.Request):
+    """Проверяет имя и пароль и выдает токен для заголовка Authorization: Bearer.
+
+    bcrypt выполняется только здесь; соединение с базой освобождается до проверки пароля.
+    Для неизвестного имени bcrypt тоже выполняется (check_missing), чтобы по времени ответа
+    нельзя было перебирать существующие имена. Учетные данные читаются с основной базы:
+    только что созданный пользователь может еще не дойти до реплики."""
+    json_data = await request.json()
+    error = validate_bulk_item(json_data, {'name': 64, 'password': None}, ('name', 'password'))
+    if error:
+        raise get_http_error(web.HTTPBadRequest, error)
+    async with read_session(primary=True) as session:
+        user = (await session.execute(
+            select(User.id, User.password).where(User.name == json_data['name']))).first()
+    if user is None:
+        await hasher.check_missing(json_data['password'])
+        raise unauthorized('Invalid name or password')
+    if not await hasher.check(json_data['password'], user.password):
+        raise unauthorized('Invalid name or password')
+    token, claims = tokens.issue(user.id)
+    return json_response({"token": token, "token_type": "Bearer", "user_id": user.id, "expires_at": claims["exp"]})
+
+
+@no_db_session
+async def logout(request: web.Request):
+    """Отзывает токен запроса."""
+    tokens.revoke(require_claims(request))
+    return json_response({"status": "logged out"})
+
+
+@no_db_session
+async def ads_views(request: web.Request):
+    """Число просмотров объявления: сохраненное в базе плюс еще не записанное этим процессом."""
+    ads_id = int(request.match_info["ads_id"])
+    stmt = (select(Ads.ads_id, func.coalesce(AdsViews.views, 0))
+            .outerjoin(AdsViews, AdsViews.ads_id == Ads.ads_id)
+            .where(Ads.ads_id == ads_id))
+    async with read_session(reads_from_primary(request)) as session:
+        row = (await session.execute(stmt)).first()
+    if row is None:
+        raise get_http_error(web.HTTPNotFound, 'Ads not found')
+    return json_response({"ads_id": ads_id, "views": row[1] + view_counter.pending_views(ads_id)})
+
+
+@unlimited
+@no_db_session
+async def hashing_stats(request: web.Request):
+    """Статистика пула хеширования паролей."""
+    return json_response(hasher.stats())
+
+
+@unlimited
+@no_db_session
+async def cache_stats(request: web.Request):
+    """Статистика кэша сущностей."""
+    return json_response(entity_cache.stats())
+
+
+@unlimited
+@no_db_session
+async def admission_stats(request: web.Request):
+    """Статистика контроля допуска: допущенные, ожидавшие и отклоненные запросы."""
+    return json_response(admission.stats())
+
+
+# Маршруты приложения, подключаются в create_app.
+routes = [
+    web.post('/login', login),
+    web.post('/logout', logout),
     web.post('/user', UserView),
+    web.post('/user/bulk', BulkUserView),
     web.get('/user/{user_id:\d+}', UserView),
     web.patch('/user/{user_id:\d+}', UserView),
     web.delete('/user/{user_id:\d+}', UserView),
 
+    web.get('/ads', AdsFeedView),
     web.get('/ads/user/{user_id:\d+}', AdsUserView),
+    web.get('/ads/search', AdsSearchView),
 
     web.post('/user/{user_id:\d+}/ads', AdsView),
     web.get('/ads/{ads_id:\d+}', AdsView),
     web.patch('/ads/{ads_id:\d+}', AdsView),
     web.delete('/ads/{ads_id:\d+}', AdsView),
-])
+    web.get('/ads/{ads_id:\d+}/views', ads_views),
+    web.post('/ads/bulk', BulkAdsView),
+    web.patch('/ads/bulk', BulkAdsView),
+
+    web.get('/stats/hashing', hashing_stats),
+    web.get('/stats/cache', cache_stats),
+    web.get('/stats/admission', admission_stats),
+    web.get('/metrics', unlimited(no_db_session(metrics_handler))),
+]
+
+registry.register_stats("password_hasher", "Password hashing pool", hasher.stats)
+registry.register_stats("entity_cache", "Entity cache", entity_cache.stats)
+registry.register_stats("singleflight", "Read coalescing", reads.stats)
+registry.register_stats("db_replicas", "Read replicas", replicas.stats)
+registry.register_stats("ads_views", "Ads view counters", view_counter.stats)
+registry.register_stats("auth", "Token authentication", tokens.stats)
+registry.register_stats("admission", "Admission control", admission.stats)
+
+
+def create_app(workers: int = 1, worker: int = 0) -> web.Application:
+    """Фабрика приложения. Вызывается в каждом процессе-воркере (worker - его номер),
+    поэтому у каждого воркера свой движок с долей общего пула соединений и свои метрики."""
+    init_engine(workers)
+    registry.set_const_labels(worker=worker)
+    entity_cache.configure_workers(workers)
+    # Запросов в обработке на воркер: по умолчанию вдвое больше соединений пула, с запасом на ответы из кэша.
+    admission.limit = ADMISSION_LIMIT or 2 * pool_capacity(workers)
+    app = web.Application()   # Создаем экземпляр класса web
+    # Гарантирует, что контекст базы данных будет корректно очищен после завершения работы приложения.
+    app.cleanup_ctx.append(orm_context)
+    app.cleanup_ctx.append(hasher_context)
+    app.cleanup_ctx.append(replicas_context)
+    if METRICS_PORT:
+        app.cleanup_ctx.append(metrics_server(METRICS_PORT + worker))  # Отдельный порт для опроса каждого воркера.
+    # Промежуточные слои применяются ко всем запросам, проходящим через приложение.
+    app.middlewares.append(metrics_middleware)  # Первым, чтобы в задержку входила работа остальных слоев.
+    app.middlewares.append(admission_middleware)  # До остальных: лишний запрос отклоняется сразу.
+    app.middlewares.append(auth_middleware)  # До сессии: запрос без токена не откроет соединение.
+    app.middlewares.append(read_your_writes_middleware)
+    app.middlewares.append(session_middleware)
+    # Формируем routes с помощью метода Application - add_routes.
+    app.add_routes(routes)
+    return app
 
 
-web.run_app(app)  # Асинхронный run
+if __name__ == '__main__':
+    from launcher import main
+    main(create_app)
@@ -0,0 +1,91 @@
+"""Объединение одинаковых одновременных чтений (single-flight).
+
+Пока запрос к базе по ключу выполняется, остальные запросы с тем же ключом не идут
+в базу, а ждут тот же результат. Запрос выполняется в отдельной задаче: отмена
+одного ожидающего клиента не прерывает его для остальных, а задача отменяется,
+только когда ждать ее больше некому."""
+import asyncio
+
+
+def _retrieve_exception(task: asyncio.Task):
+    """Ошибку получат ожидающие; если их уже нет, не засоряем лог "exception was never retrieved"."""
+    if not task.cancelled():
+        task.exception()
+
+
+class _Flight:
+    __slots__ = ('task', 'waiters', 'forgotten')
+
+    def __init__(self):
+        self.task: asyncio.Task | None = None
+        self.waiters = 0
+        self.forgotten = False  # После записи результат уже может быть устаревшим.
+
+
+class SingleFlight:
+
+    def __init__(self):
+        self._flights: dict[tuple, _Flight] = {}
+        self.leaders = 0  # Запросы, которые действительно пошли в базу.
+        self.coalesced = 0  # Запросы, присоединившиеся к уже идущему.
+        self.cancelled = 0  # Запросы к базе, отмененные, потому что все ожидающие ушли.
+
+    async def do(self, key: tuple, func, on_result=None):
+        """Возвращает результат func() для key, выполняя func не более одного раза одновременно.
+
+        on_result(result) вызывается один раз, если до завершения запроса ключ не был сброшен
+        через forget - так устаревший результат не попадет, например, в кэш."""
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight()
+            flight.task = asyncio.ensure_future(self._run(key, flight, func, on_result))
+            flight.task.add_done_callback(_retrieve_exception)
+            self._flights[key] = flight
+            self.leaders += 1
+        else:
+            self.coalesced += 1
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            if not flight.task.done() and flight.waiters == 1:  # Последний ожидающий ушел - запрос не нужен.
+                flight.task.cancel()
+                self.cancelled += 1
+                # Задача завершится позже; новые запросы не должны присоединиться к отмененной.
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+            raise
+        finally:
+            flight.waiters -= 1
+
+    async def _run(self, key: tuple, flight: _Flight, func, on_result):
+        try:
+            result = await func()
+            if on_result is not None and not flight.forgotten:
+                await on_result(result)
+            return result
+        finally:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+
+    def forget(self, key: tuple):
+        """Вызывается после записи: следующие чтения пойдут в базу заново."""
+        flight = self._flights.pop(key, None)
+        if flight is not None:
+            flight.forgotten = True
+
+    def forget_where(self, predicate):
+        """Сбрасывает все идущие запросы, ключи которых подходят под predicate."""
+        for key in [key for key in self._flights if predicate(key)]:
+            self.forget(key)
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._flights),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "cancelled": self.cancelled,
+        }
+
+
+reads = SingleFlight()
@@ -0,0 +1,73 @@
+"""Отмена и истечение срока у запроса, ждущего в очереди AdmissionController."""
+import asyncio
+
+import pytest
+from aiohttp import web
+
+from admission import AdmissionController, PRIORITY_READ
+
+ROUTE = "GET /user/{user_id}"
+
+
+def make_controller(timeout: float = 1.0) -> AdmissionController:
+    return AdmissionController(limit=1, queue_size=4, timeout=timeout, route_limits={})
+
+
+async def assert_reusable(controller: AdmissionController):
+    """Места освобождены: следующий запрос допускается сразу."""
+    assert controller.active == 0
+    assert controller.stats()["queue_depth"] == 0
+    await controller.acquire(ROUTE, PRIORITY_READ)
+    controller.release(ROUTE)
+
+
+def test_cancel_while_queued():
+    async def main():
+        controller = make_controller()
+        await controller.acquire(ROUTE, PRIORITY_READ)
+        waiting = asyncio.create_task(controller.acquire(ROUTE, PRIORITY_READ))
+        await asyncio.sleep(0)
+        waiting.cancel()  # Клиент ушел: future ожидающего отменена, но задача еще в очереди.
+        controller.release(ROUTE)  # Место освобождается в том же такте.
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        await assert_reusable(controller)
+
+    asyncio.run(main())
+
+
+def test_timeout_while_woken():
+    async def main():
+        controller = make_controller(timeout=0)
+        await controller.acquire(ROUTE, PRIORITY_READ)
+        waiting = asyncio.create_task(controller.acquire(ROUTE, PRIORITY_READ))
+        await asyncio.sleep(0)  # Запрос встал в очередь, срок уже истек.
+        await asyncio.sleep(0)  # asyncio.timeout отменил future, задача еще не проснулась.
+        assert controller._queue[0].future.cancelled()
+        controller.release(ROUTE)
+        with pytest.raises(web.HTTPServiceUnavailable):
+            await waiting
+        assert controller.timed_out == 1
+        await assert_reusable(controller)
+
+    asyncio.run(main())
+
+
+def test_evict_skips_abandoned_waiters():
+    async def main():
+        controller = AdmissionController(limit=1, queue_size=1, timeout=1.0, route_limits={})
+        await controller.acquire(ROUTE, PRIORITY_READ)
+        waiting = asyncio.create_task(controller.acquire(ROUTE, PRIORITY_READ))
+        await asyncio.sleep(0)
+        waiting.cancel()
+        newcomer = asyncio.create_task(controller.acquire(ROUTE, PRIORITY_READ))  # Очередь "полна" ушедшим.
+        await asyncio.sleep(0)
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        assert controller.evicted == 0
+        controller.release(ROUTE)
+        await newcomer
+        controller.release(ROUTE)
+        await assert_reusable(controller)
+
+    asyncio.run(main())